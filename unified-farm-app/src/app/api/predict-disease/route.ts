@@ -1,7 +1,22 @@
 import { NextRequest, NextResponse } from 'next/server';
-import { exec } from 'child_process';
-import path from 'path';
-import fs from 'fs/promises';
+
+// The Python model server (`python main.py serve`) keeps the model loaded between requests.
+const PREDICT_URL = `${process.env.PLANT_DISEASE_SERVER_URL || 'http://127.0.0.1:5000'}/predict`;
+
+// One structured line per request: the round trip minus the model server's own
+// time (its Server-Timing header) is the Node <-> Python hop.
+function logTiming(roundTripMs: number, response: Response, bytes: number) {
+  const match = /dur=([\d.]+)/.exec(response.headers.get('server-timing') || '');
+  const serverMs = match ? parseFloat(match[1]) : null;
+  console.log(JSON.stringify({
+    event: 'predict-disease',
+    status: response.status,
+    bytes,
+    roundTripMs: Math.round(roundTripMs * 10) / 10,
+    serverMs,
+    hopMs: serverMs === null ? null : Math.round((roundTripMs - serverMs) * 10) / 10,
+  }));
+}
 
 export async function POST(request: NextRequest) {
   try {
@@ -12,42 +27,41 @@ export async function POST(request: NextRequest) {
       return NextResponse.json({ error: 'No image file provided' }, { status: 400 });
     }
 
-    // Save the image temporarily
+    // Forward the raw image bytes, no temporary file needed
     const buffer = Buffer.from(await imageFile.arrayBuffer());
-    const tempDir = path.join(process.cwd(), 'tmp');
-    await fs.mkdir(tempDir, { recursive: true });
-    const tempImagePath = path.join(tempDir, imageFile.name);
-    await fs.writeFile(tempImagePath, buffer);
-
-    // Path to the Python script
-    const pythonScriptPath = path.join(process.cwd(), 'src', 'plantdiseaseprediction', 'app', 'main.py');
-
-    // Execute the Python script
-    // Note: This assumes 'python' command is available in the environment's PATH
-    // and all Python dependencies are installed.
-    const command = `python ${pythonScriptPath} ${tempImagePath}`;
-
-    return new Promise((resolve) => {
-      exec(command, async (error, stdout, stderr) => {
-        // Clean up the temporary image file
-        await fs.unlink(tempImagePath);
-
-        if (error) {
-          console.error(`exec error: ${error}`);
-          console.error(`stderr: ${stderr}`);
-          return resolve(NextResponse.json({ error: 'Prediction failed', details: stderr }, { status: 500 }));
-        }
-        
-        // The Python script is a Streamlit app, so it won't directly output the prediction.
-        // For a Next.js API, the Python script needs to be modified to output JSON.
-        // For now, we'll return a placeholder or an error indicating the need for modification.
-        console.log(`stdout: ${stdout}`);
-        resolve(NextResponse.json({ message: 'Python script executed. main.py needs modification to return prediction as JSON.', stdout: stdout }, { status: 200 }));
+
+    let response: Response;
+    const started = performance.now();
+    try {
+      response = await fetch(PREDICT_URL, {
+        method: 'POST',
+        headers: { 'Content-Type': imageFile.type || 'application/octet-stream' },
+        body: buffer,
       });
-    });
+    } catch (error) {
+      console.error('Prediction server unreachable:', error);
+      return NextResponse.json(
+        { error: 'Prediction service unavailable', details: 'Start it with `python main.py serve`' },
+        { status: 503 }
+      );
+    }
+
+    const result = await response.json();
+    logTiming(performance.now() - started, response, buffer.length);
+    if (!response.ok) {
+      return NextResponse.json(
+        { error: result.error || 'Prediction failed', details: result.details },
+        { status: response.status }
+      );
+    }
+
+    return NextResponse.json(
+      { prediction: result.label, classId: result.class_id, topK: result.top_k },
+      { status: 200 }
+    );
 
   } catch (error) {
     console.error('Error in API route:', error);
     return NextResponse.json({ error: 'Internal server error' }, { status: 500 });
   }
-}
\ No newline at end of file
+}
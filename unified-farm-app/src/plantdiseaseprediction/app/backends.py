@@ -0,0 +1,137 @@
+"""Inference backends for the plant disease model.
+
+Every backend takes a preprocessed float32 (N,224,224,3) batch in ``predict``
+and returns (N,classes) probabilities.  Each one imports only what it needs,
+so the TFLite backend starts without full TensorFlow when ``ai-edge-litert``
+or ``tflite-runtime`` is installed.
+
+    keras       .h5 / .keras file, tf.keras.models.load_model
+    savedmodel  directory written by ``export``, tf.saved_model.load
+    tflite      .tflite flatbuffer (float or int8-quantized)
+"""
+import os
+import threading
+
+import numpy as np
+
+BACKENDS = ("keras", "savedmodel", "tflite")
+
+
+def detect_backend(path):
+    if os.path.isdir(path):
+        return "savedmodel"
+    if path.endswith(".tflite"):
+        return "tflite"
+    return "keras"
+
+
+def _import_tensorflow(num_threads=None, inter_op_threads=None):
+    import tensorflow as tf
+    try:
+        if num_threads:
+            tf.config.threading.set_intra_op_parallelism_threads(num_threads)
+        if inter_op_threads:
+            tf.config.threading.set_inter_op_parallelism_threads(inter_op_threads)
+    except RuntimeError:
+        pass  # TensorFlow already ran an op in this process; its thread pools are fixed
+    return tf
+
+
+def load_backend(path, backend=None, num_threads=None, inter_op_threads=None):
+    """Load ``path`` with ``backend`` (inferred from the path if None) using ``num_threads`` CPU threads.
+
+    ``inter_op_threads`` only applies to the TensorFlow backends.
+    """
+    backend = backend or detect_backend(path)
+    if backend == "keras":
+        return KerasBackend(path, num_threads, inter_op_threads)
+    if backend == "savedmodel":
+        return SavedModelBackend(path, num_threads, inter_op_threads)
+    if backend == "tflite":
+        return TFLiteBackend(path, num_threads)
+    raise ValueError(f"unknown backend {backend!r}, expected one of {', '.join(BACKENDS)}")
+
+
+class Backend:
+    name = None
+
+    def predict(self, batch):
+        raise NotImplementedError
+
+
+class KerasBackend(Backend):
+    name = "keras"
+
+    def __init__(self, path, num_threads=None, inter_op_threads=None):
+        tf = _import_tensorflow(num_threads, inter_op_threads)
+        self.model = tf.keras.models.load_model(path, compile=False)
+        # A compiled graph with a free batch dimension: eager calls are ~10x slower per image and
+        # model.predict adds per-call dataset setup; one trace serves every batch size
+        spec = tf.TensorSpec([None, *self.model.inputs[0].shape[1:]], tf.float32)
+        self._fn = tf.function(lambda x: self.model(x, training=False), input_signature=[spec])
+
+    def predict(self, batch):
+        return np.asarray(self._fn(np.asarray(batch, dtype=np.float32)))
+
+
+class SavedModelBackend(Backend):
+    name = "savedmodel"
+
+    def __init__(self, path, num_threads=None, inter_op_threads=None):
+        tf = _import_tensorflow(num_threads, inter_op_threads)
+        self._tf = tf
+        self.model = tf.saved_model.load(path)
+        self._fn = self.model.signatures["serving_default"]
+
+    def predict(self, batch):
+        outputs = self._fn(self._tf.constant(np.asarray(batch, dtype=np.float32)))
+        return np.asarray(next(iter(outputs.values())))
+
+
+def _tflite_interpreter():
+    try:
+        from ai_edge_litert.interpreter import Interpreter
+    except ImportError:
+        try:
+            from tflite_runtime.interpreter import Interpreter
+        except ImportError:
+            import tensorflow as tf
+            Interpreter = tf.lite.Interpreter
+    return Interpreter
+
+
+class TFLiteBackend(Backend):
+    """TFLite interpreter; quantizes int8/uint8 inputs and dequantizes outputs as needed."""
+
+    name = "tflite"
+
+    def __init__(self, path, num_threads=None):
+        self.interpreter = _tflite_interpreter()(model_path=path, num_threads=num_threads)
+        self._input = self.interpreter.get_input_details()[0]
+        self._output = self.interpreter.get_output_details()[0]
+        self._batch_size = None
+        # The interpreter holds mutable tensors, so calls are serialised
+        self._lock = threading.Lock()
+
+    def _resize(self, batch_size):
+        if batch_size != self._batch_size:
+            shape = [batch_size, *self._input["shape"][1:]]
+            self.interpreter.resize_tensor_input(self._input["index"], shape)
+            self.interpreter.allocate_tensors()
+            self._batch_size = batch_size
+
+    def predict(self, batch):
+        dtype = self._input["dtype"]
+        if dtype != np.float32:
+            scale, zero_point = self._input["quantization"]
+            info = np.iinfo(dtype)
+            batch = np.clip(np.round(batch / scale + zero_point), info.min, info.max).astype(dtype)
+        with self._lock:
+            self._resize(len(batch))
+            self.interpreter.set_tensor(self._input["index"], batch)
+            self.interpreter.invoke()
+            out = self.interpreter.get_tensor(self._output["index"])
+        if self._output["dtype"] != np.float32:
+            scale, zero_point = self._output["quantization"]
+            out = (out.astype(np.float32) - zero_point) * scale
+        return out
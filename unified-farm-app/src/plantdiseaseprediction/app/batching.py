@@ -0,0 +1,135 @@
+"""Request-coalescing scheduler in front of the model.
+
+Concurrent callers submit one preprocessed (224,224,3) image each.  A single
+worker thread gathers them into a batch until either ``max_batch_size``
+images are waiting or the oldest one has waited ``max_wait_ms``, runs one
+forward pass and hands every caller its own row of probabilities.
+
+Pending images live in ``max_queue`` preallocated slots: ``submit_into``
+lets the caller decode straight into a free slot, and the worker gathers a
+batch's slots into one reused batch array, so the hot path allocates no
+image arrays.  Slots are handed out last-freed-first, so under light load
+only a few of them are ever touched (and backed by memory).
+"""
+import collections
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+import numpy as np
+
+
+class QueueFullError(Exception):
+    """Raised by ``submit`` when the pending-request queue is at capacity."""
+
+
+class MicroBatcher:
+
+    def __init__(self, run_batch, max_batch_size=16, max_wait_ms=5.0, max_queue=256, image_shape=(224, 224, 3)):
+        self.run_batch = run_batch
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self.max_queue = max_queue
+        self.images = np.empty((max_queue, *image_shape), dtype=np.float32)
+        self._free = queue.LifoQueue()
+        for slot in reversed(range(max_queue)):
+            self._free.put(slot)
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self.batch_sizes = collections.Counter()
+        self.rejected = 0
+        self._batch = np.empty((max_batch_size, *image_shape), dtype=np.float32)
+        self._thread = threading.Thread(target=self._loop, name="micro-batcher", daemon=True)
+        self._thread.start()
+
+    def submit_into(self, fill, trace=None):
+        """Call ``fill(slot)`` on a free (224,224,3) slot, queue it and return a Future of its probability row.
+
+        A ``metrics.Trace`` gets the queue wait, forward-pass time and batch size booked to it.
+        """
+        try:
+            slot = self._free.get_nowait()
+        except queue.Empty:
+            with self._lock:
+                self.rejected += 1
+            raise QueueFullError(f"prediction queue is full ({self.max_queue} pending requests)") from None
+        try:
+            fill(self.images[slot])
+        except BaseException:
+            self._free.put(slot)
+            raise
+        future = Future()
+        self._queue.put((slot, future, trace, time.perf_counter()))
+        return future
+
+    def submit(self, image, trace=None):
+        """Queue an already preprocessed image (copied into a slot)."""
+        return self.submit_into(lambda slot: np.copyto(slot, image), trace)
+
+    def predict(self, image, timeout=None, trace=None):
+        return self.submit(image, trace).result(timeout)
+
+    def predict_into(self, fill, timeout=None, trace=None):
+        return self.submit_into(fill, trace).result(timeout)
+
+    def stats(self):
+        with self._lock:
+            sizes = dict(sorted(self.batch_sizes.items()))
+            rejected = self.rejected
+        batches = sum(sizes.values())
+        images = sum(size * count for size, count in sizes.items())
+        return {
+            "batches": batches,
+            "images": images,
+            "mean_batch_size": images / batches if batches else 0.0,
+            "batch_sizes": sizes,
+            "queue_depth": self._queue.qsize(),
+            "rejected": rejected,
+        }
+
+    def _collect(self):
+        items = [self._queue.get()]
+        # Counted from when the oldest request was queued: it may already have waited out a forward pass
+        deadline = items[0][3] + self.max_wait
+        while len(items) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                items.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return items
+
+    def _loop(self):
+        while True:
+            items = self._collect()
+            # Skip callers that cancelled while queued
+            live = [item for item in items if item[1].set_running_or_notify_cancel()]
+            slots = [item[0] for item in items]
+            batch = self._batch[:len(live)]
+            if live:
+                np.take(self.images, [item[0] for item in live], axis=0, out=batch)
+            for slot in slots:
+                self._free.put(slot)
+            if not live:
+                continue
+            _, futures, traces, queued = zip(*live)
+            with self._lock:
+                self.batch_sizes[len(live)] += 1
+            start = time.perf_counter()
+            try:
+                probs = self.run_batch(batch)
+            except Exception as e:
+                for f in futures:
+                    f.set_exception(e)
+                continue
+            elapsed = time.perf_counter() - start
+            for trace, t in zip(traces, queued):
+                if trace is not None:
+                    trace.add("queue_wait", start - t)
+                    trace.add("predict", elapsed)
+                    trace.attrs["batch_size"] = len(live)
+            for f, row in zip(futures, probs):
+                f.set_result(row)
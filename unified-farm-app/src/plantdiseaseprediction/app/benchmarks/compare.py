@@ -0,0 +1,47 @@
+"""Compare two ``run_benchmarks.py`` result files.
+
+    python benchmarks/compare.py before.json after.json
+"""
+import argparse
+import json
+
+
+def _metrics(results):
+    metrics = {
+        "cold_start.total_s": results["cold_start"]["total_s"],
+        "cold_start.peak_rss_mb": results["cold_start"]["peak_rss_mb"],
+    }
+    for p in ("p50", "p95", "p99"):
+        metrics[f"latency_ms.{p}"] = results["latency_ms"][p]
+    for row in results["throughput"]:
+        metrics[f"throughput.threads={row['threads']}.batch={row['batch_size']}"] = row["images_per_second"]
+    return metrics
+
+
+def compare(before, after):
+    old, new = _metrics(before), _metrics(after)
+    rows = []
+    for name in old.keys() | new.keys():
+        a, b = old.get(name), new.get(name)
+        change = f"{(b - a) / a * 100:+.1f}%" if a and b is not None else ""
+        rows.append((name, a, b, change))
+    return sorted(rows)
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("before")
+    parser.add_argument("after")
+    args = parser.parse_args()
+    with open(args.before) as f:
+        before = json.load(f)
+    with open(args.after) as f:
+        after = json.load(f)
+
+    print(f"{'metric':<40} {before['meta']['commit'] or 'before':>14} {after['meta']['commit'] or 'after':>14} {'change':>8}")
+    for name, a, b, change in compare(before, after):
+        print(f"{name:<40} {'' if a is None else a:>14} {'' if b is None else b:>14} {change:>8}")
+
+
+if __name__ == "__main__":
+    main_cli()
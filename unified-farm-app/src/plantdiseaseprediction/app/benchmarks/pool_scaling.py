@@ -0,0 +1,160 @@
+"""How serving throughput scales with the number of model worker processes.
+
+    python benchmarks/pool_scaling.py [--model PATH] [--backend tflite] [--workers 0,1,2,4,8]
+                                      [--threads-per-worker 1] [--affinity] [--clients 32]
+                                      [--seconds 10] [--out scaling.json]
+
+For every worker count the server's ``Predictor`` is driven directly (no HTTP)
+by ``--clients`` threads posting synthetic uploads back to back for
+``--seconds``; ``0`` workers is the in-process micro-batcher for reference.
+Each row reports images/s, p50/p95/p99 latency and the batch sizes formed.
+Uses the same model selection as ``run_benchmarks.py``.
+"""
+import argparse
+import json
+import os
+import platform
+import tempfile
+import threading
+import time
+
+from run_benchmarks import git_commit, percentiles
+
+import main  # noqa: E402  (run_benchmarks put the app directory on sys.path)
+import synthetic  # noqa: E402
+from batching import QueueFullError  # noqa: E402
+from pool import WorkerPool  # noqa: E402
+from server import WORKER_START_TIMEOUT, Predictor  # noqa: E402
+
+# Typical uploads once the browser has resized them; decoding stays a small share
+SCALING_UPLOADS = [(1024, 768, "JPEG"), (800, 600, "JPEG"), (640, 480, "JPEG")]
+
+
+def drive(predictor, uploads, clients, seconds):
+    latencies, rejected, lock = [], [0], threading.Lock()
+    deadline = time.perf_counter() + seconds
+
+    def client(offset):
+        i = offset
+        mine, busy = [], 0
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            try:
+                predictor.predict_bytes(uploads[i % len(uploads)], use_cache=False)
+            except QueueFullError:
+                busy += 1
+                time.sleep(0.001)
+                continue
+            mine.append((time.perf_counter() - start) * 1000)
+            i += 1
+        with lock:
+            latencies.extend(mine)
+            rejected[0] += busy
+
+    threads = [threading.Thread(target=client, args=(i,)) for i in range(clients)]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return latencies, rejected[0], time.perf_counter() - start
+
+
+def run_point(args, class_indices, uploads, workers):
+    pool = model = None
+    start = time.perf_counter()
+    if not workers:
+        model = main.load_model(args.model, args.backend, args.threads_per_worker)
+        main.warm_up(model)
+    else:
+        pool = WorkerPool(args.model, args.backend, workers, args.threads_per_worker, args.affinity,
+                          args.max_batch_size)
+    try:
+        if pool is not None:
+            pool.wait_ready(WORKER_START_TIMEOUT)
+        ready = time.perf_counter() - start
+        predictor = Predictor(model, class_indices, max_batch_size=args.max_batch_size, pool=pool)
+        drive(predictor, uploads, args.clients, 1.0)  # let every worker see each batch shape once
+        before = predictor.batcher.stats()["images"]
+        latencies, rejected, elapsed = drive(predictor, uploads, args.clients, args.seconds)
+        stats = predictor.batcher.stats()
+    finally:
+        if pool is not None:
+            pool.close()
+    return {
+        "workers": workers,
+        "threads_per_worker": args.threads_per_worker,
+        "startup_s": round(ready, 2),
+        "images_per_second": round((stats["images"] - before) / elapsed, 2),
+        "latency_ms": percentiles(latencies) if latencies else None,
+        "mean_batch_size": round(stats["mean_batch_size"], 2),
+        "rejected": rejected,
+    }
+
+
+def _ints(value):
+    return [int(v) for v in value.split(",") if v]
+
+
+def main_cli():
+    cpus = os.cpu_count() or 1
+    parser = argparse.ArgumentParser(description="Worker pool scaling report")
+    parser.add_argument("--model", help="model to serve (default: real weights if present, else a stand-in)")
+    parser.add_argument("--backend", choices=["keras", "savedmodel", "tflite"])
+    parser.add_argument("--classes", default=main.class_indices_path)
+    parser.add_argument("--arch", default="mobilenetv2", choices=["mobilenetv2", "small"], help="stand-in architecture")
+    parser.add_argument("--workers", type=_ints, default=[0] + [n for n in (1, 2, 4, 8, 16, 32) if n <= cpus],
+                        help="worker counts to measure, 0 is the in-process server")
+    parser.add_argument("--threads-per-worker", type=int, default=1)
+    parser.add_argument("--affinity", action="store_true")
+    parser.add_argument("--max-batch-size", type=int, default=8)
+    parser.add_argument("--clients", type=int, default=32, help="concurrent requests kept in flight")
+    parser.add_argument("--seconds", type=float, default=10.0, help="measured time per worker count")
+    parser.add_argument("--out", help="write results JSON here as well as to stdout")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        standin = None
+        if not args.model:
+            if os.path.exists(main.model_path):
+                args.model = main.model_path
+            else:
+                standin = args.arch
+                args.model = synthetic.build_standin_model(
+                    os.path.join(tmp, f"standin_{args.arch}.h5"), synthetic.num_classes(args.classes), args.arch)
+        uploads = []
+        for path in synthetic.make_uploads(tmp, SCALING_UPLOADS):
+            with open(path, "rb") as f:
+                uploads.append(f.read())
+        class_indices = main.load_class_indices(args.classes)
+
+        results = {
+            "meta": {
+                "commit": git_commit(),
+                "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "cpu_count": cpus,
+                "model": os.path.basename(args.model.rstrip("/\\")),
+                "stand_in": standin,
+                "backend": args.backend,
+                "clients": args.clients,
+                "seconds": args.seconds,
+            },
+            "scaling": [],
+        }
+        for workers in args.workers:
+            row = run_point(args, class_indices, uploads, workers)
+            print(f"workers={workers:<3} {row['images_per_second']:>8} img/s  "
+                  f"p50 {row['latency_ms']['p50'] if row['latency_ms'] else '-'} ms", flush=True)
+            results["scaling"].append(row)
+
+    text = json.dumps(results, indent=2)
+    if args.out:
+        with open(args.out, "w") as f:
+            f.write(text + "\n")
+    print(text)
+
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,87 @@
+"""Micro-benchmark: the original (reference) preprocessing vs ``preprocess.BatchBuffer``.
+
+    python benchmarks/preprocess_bench.py [--images DIR] [--model plant_disease_Pred1.h5]
+
+Without ``--images`` a few synthetic phone-sized photos are generated.  Prints
+per-image time for both paths and the numerical difference between them;
+with ``--model`` also the top-1 agreement of the two paths.
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+from PIL import Image
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import main  # noqa: E402
+import preprocess  # noqa: E402
+from synthetic import UPLOAD_SIZES, make_uploads  # noqa: E402
+
+
+def reference_preprocess(path):
+    """The app's original preprocessing: resize, then RGB, then float64 scaling; ignores EXIF."""
+    img = Image.open(path)
+    img = img.resize(main.IMAGE_SIZE)
+    img = img.convert("RGB")
+    return np.array(img) / 255.0
+
+
+def time_per_image(fn, paths, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for i, path in enumerate(paths):
+            fn(i, path)
+    return (time.perf_counter() - start) / (repeat * len(paths)) * 1000
+
+
+def run(paths, repeat, model_path=None):
+    buffer = preprocess.BatchBuffer(len(paths))
+    reference = np.empty((len(paths), *main.IMAGE_SIZE, 3))
+
+    def legacy(i, path):
+        reference[i] = reference_preprocess(path)
+
+    report = {
+        "images": len(paths),
+        "reference_ms": round(time_per_image(legacy, paths, repeat), 2),
+        "fast_ms": round(time_per_image(buffer.fill, paths, repeat), 2),
+    }
+    report["speedup"] = round(report["reference_ms"] / report["fast_ms"], 2)
+
+    diff = np.abs(buffer.array - reference)
+    report["mean_abs_diff"] = float(diff.mean())
+    report["max_abs_diff"] = float(diff.max())
+
+    if model_path:
+        model = main.load_model(model_path)
+        ref_top1 = main.run_model(model, reference.astype(np.float32)).argmax(axis=1)
+        fast_top1 = main.run_model(model, buffer.array).argmax(axis=1)
+        report["top1_agreement"] = float((ref_top1 == fast_top1).mean())
+    return report
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--images", help="directory of real photos (defaults to synthetic ones)")
+    parser.add_argument("--model", help="also report top-1 agreement using this model")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        if args.images:
+            paths = sorted(
+                os.path.join(args.images, f) for f in os.listdir(args.images)
+                if f.lower().endswith((".jpg", ".jpeg", ".png"))
+            )
+        else:
+            paths = make_uploads(tmp, UPLOAD_SIZES[:4])
+        print(json.dumps(run(paths, args.repeat, args.model), indent=2))
+
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,227 @@
+"""Reproducible inference benchmark suite for the plant disease predictor.
+
+    python benchmarks/run_benchmarks.py [--model PATH] [--backend tflite] [--arch mobilenetv2|small]
+                                        [--batch-sizes 1,4,8,16,32] [--threads 1,2,4]
+                                        [--requests 100] [--out results.json]
+
+Uses the real model when ``--model`` is given or ``trained_model/plant_disease_Pred1.h5``
+exists, otherwise a stand-in with the same contract (see ``synthetic.py``).
+Every measurement runs in a fresh process so imports and memory are not shared:
+
+    cold_start   import + model load, and the first prediction
+    latency_ms   one synthetic upload -> label (decode, preprocess, forward pass), p50/p95/p99
+    throughput   forward-pass images/s for every batch size x thread count
+    peak_rss_mb  reported by each of the above
+
+Results are written as JSON together with the git commit and machine details;
+compare two runs with ``benchmarks/compare.py``.
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, APP_DIR)
+
+import main  # noqa: E402
+import synthetic  # noqa: E402
+
+
+def peak_rss_mb():
+    try:
+        import resource
+    except ImportError:  # not available on Windows
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return round(rss / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def percentiles(samples):
+    p50, p95, p99 = np.percentile(samples, [50, 95, 99])
+    return {"p50": round(float(p50), 2), "p95": round(float(p95), 2), "p99": round(float(p99), 2),
+            "mean": round(float(np.mean(samples)), 2), "n": len(samples)}
+
+
+# ---- stages, each run in its own process --------------------------------------------------------
+
+def stage_cold(args):
+    start = time.perf_counter()
+    model = main.load_model(args.model, args.backend, args.num_threads)
+    loaded = time.perf_counter()
+    main.warm_up(model)
+    done = time.perf_counter()
+    result = {
+        "import_and_load_s": round(loaded - start, 3),
+        "first_predict_s": round(done - loaded, 3),
+        "total_s": round(done - start, 3),
+        "backend": model.name,
+    }
+    if "tensorflow" in sys.modules:
+        result["tensorflow"] = sys.modules["tensorflow"].__version__
+    return result
+
+
+def stage_latency(args):
+    import preprocess
+
+    model = main.load_model(args.model, args.backend, args.num_threads)
+    class_indices = main.load_class_indices(args.classes)
+    main.warm_up(model)
+    uploads = []
+    for path in args.uploads:
+        with open(path, "rb") as f:
+            uploads.append((os.path.basename(path), f.read()))
+
+    samples, per_upload = [], {name: [] for name, _ in uploads}
+    for i in range(args.requests):
+        name, data = uploads[i % len(uploads)]
+        start = time.perf_counter()
+        image = preprocess.preprocess(data)
+        main.decode_prediction(main.run_model(model, image[np.newaxis])[0], class_indices)
+        elapsed = (time.perf_counter() - start) * 1000
+        samples.append(elapsed)
+        per_upload[name].append(elapsed)
+    return {
+        **percentiles(samples),
+        "per_upload_p50": {name: round(float(np.median(s)), 2) for name, s in per_upload.items() if s},
+    }
+
+
+def stage_throughput(args):
+    model = main.load_model(args.model, args.backend, args.num_threads)
+    rng = np.random.default_rng(0)
+    rows = []
+    for batch_size in args.batch_sizes:
+        batch = rng.random((batch_size, *main.IMAGE_SIZE, 3), dtype=np.float32)
+        main.run_model(model, batch)  # trace / allocate for this shape
+        iterations, start = 0, time.perf_counter()
+        while iterations < 3 or time.perf_counter() - start < args.min_seconds:
+            main.run_model(model, batch)
+            iterations += 1
+        elapsed = time.perf_counter() - start
+        rows.append({
+            "threads": args.num_threads,
+            "batch_size": batch_size,
+            "images_per_second": round(iterations * batch_size / elapsed, 2),
+            "batch_ms": round(elapsed / iterations * 1000, 2),
+        })
+    return rows
+
+
+STAGES = {"cold": stage_cold, "latency": stage_latency, "throughput": stage_throughput}
+
+
+def run_stage(stage, args, num_threads=None, uploads=()):
+    cmd = [sys.executable, os.path.abspath(__file__), "--stage", stage, "--model", args.model,
+           "--classes", args.classes, "--requests", str(args.requests),
+           "--batch-sizes", ",".join(map(str, args.batch_sizes)), "--min-seconds", str(args.min_seconds)]
+    if args.backend:
+        cmd += ["--backend", args.backend]
+    if num_threads:
+        cmd += ["--num-threads", str(num_threads)]
+    for path in uploads:
+        cmd += ["--upload", path]
+    proc = subprocess.run(cmd, cwd=APP_DIR, capture_output=True, text=True)
+    if proc.returncode != 0:
+        raise RuntimeError(f"benchmark stage {stage} failed:\n{proc.stderr[-4000:]}")
+    # Libraries may print to stdout; the result is always the last line
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+def git_commit():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=APP_DIR,
+                                capture_output=True, text=True, check=True).stdout.strip()
+        dirty = subprocess.run(["git", "status", "--porcelain", "--", "."], cwd=APP_DIR,
+                               capture_output=True, text=True).stdout.strip()
+        return commit + ("-dirty" if dirty else "")
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_suite(args, tmp):
+    standin = None
+    if not args.model:
+        if os.path.exists(main.model_path):
+            args.model = main.model_path
+        else:
+            standin = args.arch
+            args.model = synthetic.build_standin_model(
+                os.path.join(tmp, f"standin_{args.arch}.h5"), synthetic.num_classes(args.classes), args.arch)
+    uploads = synthetic.make_uploads(tmp)
+
+    results = {
+        "meta": {
+            "commit": git_commit(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "model": os.path.basename(args.model.rstrip("/\\")),
+            "stand_in": standin,
+            "backend": args.backend,
+            "uploads": [os.path.basename(p) for p in uploads],
+        },
+    }
+    results["cold_start"] = run_stage("cold", args)
+    results["latency_ms"] = run_stage("latency", args, uploads=uploads)
+    results["throughput"] = []
+    for threads in args.threads:
+        results["throughput"] += run_stage("throughput", args, num_threads=threads)
+    return results
+
+
+def _ints(value):
+    return [int(v) for v in value.split(",") if v]
+
+
+def parse_args(argv=None):
+    cpus = os.cpu_count() or 1
+    parser = argparse.ArgumentParser(description="Plant disease inference benchmarks")
+    parser.add_argument("--model", help="model to benchmark (default: real weights if present, else a stand-in)")
+    parser.add_argument("--backend", choices=["keras", "savedmodel", "tflite"])
+    parser.add_argument("--classes", default=main.class_indices_path)
+    parser.add_argument("--arch", default="mobilenetv2", choices=["mobilenetv2", "small"], help="stand-in architecture")
+    parser.add_argument("--batch-sizes", type=_ints, default=[1, 4, 8, 16, 32])
+    parser.add_argument("--threads", type=_ints, default=sorted({t for t in (1, 2, 4, cpus) if t <= cpus}))
+    parser.add_argument("--requests", type=int, default=100, help="uploads timed for the latency percentiles")
+    parser.add_argument("--min-seconds", type=float, default=1.0, help="minimum time per throughput point")
+    parser.add_argument("--out", help="write results JSON here as well as to stdout")
+    # internal: run a single stage in this process
+    parser.add_argument("--stage", choices=sorted(STAGES), help=argparse.SUPPRESS)
+    parser.add_argument("--num-threads", type=int, help=argparse.SUPPRESS)
+    parser.add_argument("--upload", dest="uploads", action="append", default=[], help=argparse.SUPPRESS)
+    return parser.parse_args(argv)
+
+
+def main_cli():
+    args = parse_args()
+    if args.stage:
+        result = STAGES[args.stage](args)
+        if isinstance(result, dict):
+            result["peak_rss_mb"] = peak_rss_mb()
+        else:
+            for row in result:
+                row["peak_rss_mb"] = peak_rss_mb()
+        print(json.dumps(result))
+        return
+
+    with tempfile.TemporaryDirectory() as tmp:
+        results = run_suite(args, tmp)
+    text = json.dumps(results, indent=2)
+    if args.out:
+        with open(args.out, "w") as f:
+            f.write(text + "\n")
+    print(text)
+
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,65 @@
+"""Synthetic uploads and a stand-in model for benchmarking without the real weights.
+
+The real ``plant_disease_Pred1.h5`` is only linked from ``trained_model.txt``;
+the stand-in has the same contract (224x224x3 float input in 0..1, softmax
+over the classes in ``class_indices.json``) so every code path can be timed.
+"""
+import json
+import os
+
+import numpy as np
+from PIL import Image
+
+# (width, height, format): phone photos down to a pre-cropped web upload
+UPLOAD_SIZES = [
+    (4000, 3000, "JPEG"),
+    (3264, 2448, "JPEG"),
+    (1600, 1200, "JPEG"),
+    (1024, 768, "PNG"),
+    (640, 480, "JPEG"),
+]
+
+
+def synthetic_photo(width, height, seed):
+    """Smooth, leaf-like colour field with some texture; noise alone would exaggerate resampling differences."""
+    rng = np.random.default_rng(seed)
+    small = rng.integers(0, 256, size=(height // 100 + 2, width // 100 + 2, 3), dtype=np.uint8)
+    img = Image.fromarray(small).resize((width, height), Image.BICUBIC)
+    texture = rng.normal(0, 6, size=(height, width, 1))
+    return Image.fromarray(np.clip(np.asarray(img) + texture, 0, 255).astype(np.uint8))
+
+
+def make_uploads(directory, sizes=UPLOAD_SIZES):
+    """Write one synthetic photo per entry of ``sizes`` and return their paths."""
+    paths = []
+    for i, (width, height, fmt) in enumerate(sizes):
+        path = os.path.join(directory, f"synthetic_{width}x{height}.{fmt.lower()}")
+        synthetic_photo(width, height, i).save(path, fmt, quality=90)
+        paths.append(path)
+    return paths
+
+
+def num_classes(class_indices_path):
+    with open(class_indices_path) as f:
+        return len(json.load(f))
+
+
+def build_standin_model(path, classes, arch="mobilenetv2"):
+    """Save an untrained Keras model with the service's input/output contract to ``path``."""
+    import tensorflow as tf
+
+    if arch == "mobilenetv2":
+        # Comparable compute to a typical transfer-learned 224x224 leaf classifier
+        model = tf.keras.applications.MobileNetV2(input_shape=(224, 224, 3), weights=None, classes=classes)
+    elif arch == "small":
+        model = tf.keras.Sequential([
+            tf.keras.Input((224, 224, 3)),
+            tf.keras.layers.Conv2D(16, 3, strides=2, activation="relu"),
+            tf.keras.layers.Conv2D(32, 3, strides=2, activation="relu"),
+            tf.keras.layers.GlobalAveragePooling2D(),
+            tf.keras.layers.Dense(classes, activation="softmax"),
+        ])
+    else:
+        raise ValueError(f"unknown stand-in architecture {arch!r}")
+    model.save(path)
+    return path
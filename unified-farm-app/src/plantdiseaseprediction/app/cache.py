@@ -0,0 +1,169 @@
+"""Content-addressed cache of prediction probabilities.
+
+Entries are keyed by the SHA-256 of the uploaded image bytes plus a
+fingerprint of the model weights and ``class_indices.json``, so replacing
+either file changes every key and stale predictions are never served.
+There is an in-memory LRU tier bounded by bytes and an optional SQLite tier
+that several worker processes can share.  Services with different models
+(a cascade and a plain server, old and new versions during a deploy) can
+share one SQLite file: their keys never collide.  The SQLite tier is bounded
+by ``max_db_rows``: every row remembers when it was last read from or written
+to the file, and every ``DB_PRUNE_EVERY`` writes the least recently used rows
+beyond the cap are deleted, so rows of a retired model age out on their own.
+Between checks each process can overshoot the cap by up to ``DB_PRUNE_EVERY``
+rows.
+"""
+import collections
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+
+import numpy as np
+
+_CHUNK = 1 << 20
+# About 0.5 KB a row with the 80-class model, index included
+DEFAULT_DB_ROWS = 500_000
+DB_PRUNE_EVERY = 256
+
+
+def _files(path):
+    if not os.path.isdir(path):
+        return [path]
+    # A SavedModel is a directory; hash its files in a stable order
+    return sorted(os.path.join(root, name) for root, _, names in os.walk(path) for name in names)
+
+
+def fingerprint(*paths, salt=""):
+    """Short hash of the contents of ``paths`` (model weights, class names ...) and ``salt``."""
+    digest = hashlib.sha256(salt.encode())
+    for path in paths:
+        for file in _files(path):
+            with open(file, "rb") as f:
+                for chunk in iter(lambda: f.read(_CHUNK), b""):
+                    digest.update(chunk)
+    return digest.hexdigest()[:16]
+
+
+def _size(key, probs):
+    return len(key) + probs.nbytes
+
+
+class PredictionCache:
+
+    def __init__(self, model_fingerprint, max_bytes=64 * 1024 * 1024, db_path=None, max_db_rows=DEFAULT_DB_ROWS):
+        self.model_fingerprint = model_fingerprint
+        self.max_bytes = max_bytes
+        self.max_db_rows = max_db_rows
+        self._entries = collections.OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.counters = collections.Counter(hits=0, disk_hits=0, misses=0, evictions=0, disk_evictions=0, bypassed=0)
+        self._db = None
+        self._db_rows = 0  # as of the last prune
+        self._db_writes = 0
+        # Disk reads and writes take their own lock so in-memory hits never wait behind them
+        self._db_lock = threading.Lock()
+        if db_path:
+            self._db = sqlite3.connect(db_path, timeout=30, check_same_thread=False, isolation_level=None)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS predictions (key TEXT PRIMARY KEY, model TEXT NOT NULL, probs BLOB NOT NULL,"
+                " last_used REAL NOT NULL DEFAULT 0)"
+            )
+            columns = [row[1] for row in self._db.execute("PRAGMA table_info(predictions)")]
+            if "last_used" not in columns:
+                try:
+                    self._db.execute("ALTER TABLE predictions ADD COLUMN last_used REAL NOT NULL DEFAULT 0")
+                except sqlite3.OperationalError:
+                    pass  # another process sharing the file added it first
+            self._db.execute("CREATE INDEX IF NOT EXISTS predictions_last_used ON predictions (last_used)")
+            with self._db_lock:
+                self._prune()
+
+    def key(self, data):
+        return f"{self.model_fingerprint}:{hashlib.sha256(data).hexdigest()}"
+
+    def get(self, key):
+        with self._lock:
+            probs = self._entries.get(key)
+            if probs is not None:
+                self._entries.move_to_end(key)
+                self.counters["hits"] += 1
+                return probs
+        row = None
+        if self._db is not None:
+            with self._db_lock:
+                row = self._db.execute("SELECT probs FROM predictions WHERE key = ?", (key,)).fetchone()
+                if row is not None:
+                    self._db.execute("UPDATE predictions SET last_used = ? WHERE key = ?", (time.time(), key))
+        with self._lock:
+            if row is not None:
+                probs = np.frombuffer(row[0], dtype=np.float32)
+                self._remember(key, probs)
+                self.counters["disk_hits"] += 1
+                return probs
+            self.counters["misses"] += 1
+            return None
+
+    def put(self, key, probs):
+        # Copy: a row of a batch output is a view that would keep the whole batch alive
+        probs = np.array(probs, dtype=np.float32)
+        with self._lock:
+            self._remember(key, probs)
+        if self._db is not None:
+            with self._db_lock:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO predictions (key, model, probs, last_used) VALUES (?, ?, ?, ?)",
+                    (key, self.model_fingerprint, probs.tobytes(), time.time()),
+                )
+                self._db_writes += 1
+                if self._db_writes % DB_PRUNE_EVERY == 0:
+                    self._prune()
+
+    def bypass(self):
+        """Count a lookup skipped on purpose (accuracy audits)."""
+        with self._lock:
+            self.counters["bypassed"] += 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                **self.counters,
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "disk_rows": self._db_rows,
+                "max_disk_rows": self.max_db_rows if self._db is not None else None,
+                "model": self.model_fingerprint,
+            }
+
+    def close(self):
+        if self._db is not None:
+            with self._db_lock:
+                self._db.close()
+
+    def _prune(self):
+        # Caller holds self._db_lock. Counts every model's rows: the cap is for the whole file.
+        rows = self._db.execute("SELECT COUNT(*) FROM predictions").fetchone()[0]
+        evicted = 0
+        if rows > self.max_db_rows:
+            evicted = self._db.execute(
+                "DELETE FROM predictions WHERE key IN (SELECT key FROM predictions ORDER BY last_used LIMIT ?)",
+                (rows - self.max_db_rows,),
+            ).rowcount
+        with self._lock:
+            self._db_rows = rows - evicted
+            self.counters["disk_evictions"] += evicted
+
+    def _remember(self, key, probs):
+        old = self._entries.pop(key, None)
+        if old is not None:
+            self._bytes -= _size(key, old)
+        self._entries[key] = probs
+        self._bytes += _size(key, probs)
+        while self._bytes > self.max_bytes and self._entries:
+            evicted_key, evicted = self._entries.popitem(last=False)
+            self._bytes -= _size(evicted_key, evicted)
+            self.counters["evictions"] += 1
@@ -0,0 +1,168 @@
+"""Confidence-gated model cascade: a cheap first stage, the full model only when unsure.
+
+``Cascade`` wraps two loaded backends and behaves like one.  Every batch goes
+through the first-stage model; rows whose top-1 probability is at or above
+``threshold`` keep its answer, and only the remaining rows are run through
+the full model.  Both models take the same preprocessed (N,224,224,3) input
+and must predict the same classes; a low-resolution first stage downsamples
+inside the model (e.g. a leading ``AveragePooling2D``).
+
+``Routing`` counts how many images each stage answered and the time spent
+in each, for ``/stats`` and ``/metrics``.  ``evaluate`` runs both models over
+a labelled folder once and reports, for a range of thresholds, the share of
+traffic the first stage would take, the accuracy lost against the full model
+and the compute saved, to pick the threshold:
+
+    python main.py --cascade-model trained_model/screen.tflite cascade-eval --images labelled/
+"""
+import itertools
+import threading
+import time
+
+import numpy as np
+
+import export
+import main
+from backends import Backend
+
+THRESHOLDS = (0.5, 0.6, 0.7, 0.8, 0.85, 0.9, 0.95, 0.98, 0.99)
+
+
+class Routing:
+
+    def __init__(self, threshold):
+        self.threshold = threshold
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.first = self.full = 0
+            self.first_seconds = self.full_seconds = 0.0
+
+    def record(self, first, full, first_seconds, full_seconds):
+        with self._lock:
+            self.first += first
+            self.full += full
+            self.first_seconds += first_seconds
+            self.full_seconds += full_seconds
+
+    def stats(self):
+        with self._lock:
+            total = self.first + self.full
+            return {
+                "threshold": self.threshold,
+                "first_stage": self.first,
+                "full_model": self.full,
+                "first_stage_share": self.first / total if total else 0.0,
+                "first_stage_seconds": round(self.first_seconds, 3),
+                "full_model_seconds": round(self.full_seconds, 3),
+            }
+
+
+class Cascade(Backend):
+    name = "cascade"
+
+    def __init__(self, first, full, threshold=main.CASCADE_THRESHOLD):
+        self.first = first
+        self.full = full
+        self.threshold = threshold
+        self.routing = Routing(threshold)
+        # (first, full, first_seconds, full_seconds) of the latest batch, for pool workers to report
+        self.last_routing = (0, 0, 0.0, 0.0)
+        probe = np.zeros((1, *main.IMAGE_SIZE, 3), dtype=np.float32)
+        first_classes = main.run_model(first, probe).shape[-1]
+        full_classes = main.run_model(full, probe).shape[-1]
+        if first_classes != full_classes:
+            raise ValueError(f"the cascade model predicts {first_classes} classes, the full model {full_classes}")
+
+    def predict(self, batch):
+        start = time.perf_counter()
+        probs = main.run_model(self.first, batch)
+        first_seconds = time.perf_counter() - start
+        unsure = np.flatnonzero(probs.max(axis=1) < self.threshold)
+        full_seconds = 0.0
+        if unsure.size:
+            start = time.perf_counter()
+            rows = batch if unsure.size == len(batch) else batch[unsure]
+            probs = np.array(probs, dtype=np.float32)
+            probs[unsure] = main.run_model(self.full, rows)
+            full_seconds = time.perf_counter() - start
+        self.last_routing = (len(batch) - unsure.size, int(unsure.size), first_seconds, full_seconds)
+        self.routing.record(*self.last_routing)
+        return probs
+
+
+def evaluate(first, full, images_dir, class_indices, thresholds=THRESHOLDS, batch_size=32, limit=None,
+             max_accuracy_loss=0.01):
+    """Threshold sweep for ``first`` in front of ``full`` on ``images_dir`` (one sub-folder per class label).
+
+    Without labels the loss is measured as disagreement with the full model.
+    The recommended threshold saves the most compute within
+    ``max_accuracy_loss``.  Compute saved assumes the full model's cost is
+    proportional to the images it sees, which holds for batched serving.
+    """
+    label_ids = {label: int(i) for i, label in class_indices.items()}
+    first_probs, full_probs, truth = [], [], []
+    models, seconds = (first, full), [0.0, 0.0]
+    warmed = set()
+    images = export.iter_images(images_dir, limit)
+    for index, batch in enumerate(iter(lambda: list(itertools.islice(images, batch_size)), [])):
+        names, arrays = zip(*batch)
+        arrays = np.stack(arrays)
+        if len(arrays) not in warmed:
+            # Untimed run of both models at every batch shape seen (full and last partial batch)
+            warmed.add(len(arrays))
+            main.run_model(first, arrays)
+            main.run_model(full, arrays)
+        # Alternate which model goes first so neither pays for the other's cache misses
+        probs = [None, None]
+        for stage in (0, 1) if index % 2 == 0 else (1, 0):
+            start = time.perf_counter()
+            probs[stage] = main.run_model(models[stage], arrays)
+            seconds[stage] += time.perf_counter() - start
+        first_probs.append(probs[0])
+        full_probs.append(probs[1])
+        truth += [label_ids.get(name.split("/")[0], -1) for name in names]
+    if not truth:
+        raise ValueError(f"no readable images in {images_dir}")
+
+    first_probs, full_probs, truth = np.concatenate(first_probs), np.concatenate(full_probs), np.array(truth)
+    confidence = first_probs.max(axis=1)
+    first_top1, full_top1 = first_probs.argmax(axis=1), full_probs.argmax(axis=1)
+    labelled = truth >= 0
+    count = len(truth)
+    first_cost, full_cost = seconds[0] / count, seconds[1] / count
+
+    def accuracy(top1):
+        return float((top1[labelled] == truth[labelled]).mean()) if labelled.any() else None
+
+    full_accuracy = accuracy(full_top1)
+    rows = []
+    for threshold in thresholds:
+        take = confidence >= threshold
+        top1 = np.where(take, first_top1, full_top1)
+        agreement = float((top1 == full_top1).mean())
+        cascade_accuracy = accuracy(top1)
+        share = float(take.mean())
+        rows.append({
+            "threshold": threshold,
+            "first_stage_share": round(share, 4),
+            "accuracy": cascade_accuracy,
+            "agreement_with_full": round(agreement, 4),
+            "accuracy_loss": round(full_accuracy - cascade_accuracy if labelled.any() else 1 - agreement, 4),
+            "compute_saved": round(1 - (first_cost + (1 - share) * full_cost) / full_cost, 4),
+        })
+    acceptable = [row for row in rows if row["accuracy_loss"] <= max_accuracy_loss and row["compute_saved"] > 0]
+    best = max(acceptable, key=lambda row: row["compute_saved"]) if acceptable else None
+    return {
+        "images": count,
+        "labelled": int(labelled.sum()),
+        "first_stage_ms_per_image": round(first_cost * 1000, 3),
+        "full_model_ms_per_image": round(full_cost * 1000, 3),
+        "first_stage_accuracy": accuracy(first_top1),
+        "full_model_accuracy": full_accuracy,
+        "max_accuracy_loss": max_accuracy_loss,
+        "recommended_threshold": best["threshold"] if best else None,
+        "thresholds": rows,
+    }
@@ -0,0 +1,97 @@
+"""Convert the Keras model to other backends and compare their predictions.
+
+    python main.py export --out-dir exported --calibration DIR
+        -> exported/saved_model/, exported/model_float.tflite, exported/model_int8.tflite
+
+    python main.py parity --images DIR keras=plant_disease_Pred1.h5 int8=exported/model_int8.tflite
+        -> top-1 agreement and max probability delta of each backend against the first,
+           plus top-1 accuracy when DIR has one sub-folder per class label
+"""
+import itertools
+import os
+
+import numpy as np
+
+import backends
+import preprocess
+import scoring
+
+
+def iter_images(directory, limit=None):
+    """Yield ``(name, float32 image)`` for the images under ``directory``, skipping unreadable ones."""
+    sources = scoring.iter_sources(directory)
+    for name, read in itertools.islice(sources, limit):
+        try:
+            yield name, preprocess.preprocess(read())
+        except Exception:
+            continue
+
+
+def _batches(iterable, size):
+    iterator = iter(iterable)
+    while batch := list(itertools.islice(iterator, size)):
+        yield batch
+
+
+def export(model_path, out_dir, calibration_dir, calibration_count=200):
+    import tensorflow as tf
+
+    os.makedirs(out_dir, exist_ok=True)
+    model = tf.keras.models.load_model(model_path, compile=False)
+    saved_model_dir = os.path.join(out_dir, "saved_model")
+    if hasattr(model, "export"):
+        model.export(saved_model_dir)  # Keras 3
+    else:
+        tf.saved_model.save(model, saved_model_dir)
+    written = {"savedmodel": saved_model_dir}
+
+    converter = tf.lite.TFLiteConverter.from_saved_model(saved_model_dir)
+    written["tflite"] = os.path.join(out_dir, "model_float.tflite")
+    with open(written["tflite"], "wb") as f:
+        f.write(converter.convert())
+
+    def representative_dataset():
+        for _, image in iter_images(calibration_dir, calibration_count):
+            yield [image[np.newaxis]]
+
+    converter = tf.lite.TFLiteConverter.from_saved_model(saved_model_dir)
+    converter.optimizations = [tf.lite.Optimize.DEFAULT]
+    converter.representative_dataset = representative_dataset
+    converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS_INT8]
+    converter.inference_input_type = tf.int8
+    converter.inference_output_type = tf.int8
+    written["tflite_int8"] = os.path.join(out_dir, "model_int8.tflite")
+    with open(written["tflite_int8"], "wb") as f:
+        f.write(converter.convert())
+    return written
+
+
+def parity_report(models, images_dir, class_indices, batch_size=32, limit=None):
+    """Compare ``models`` (name -> model path) on ``images_dir``; the first model is the reference."""
+    loaded = {name: backends.load_backend(path) for name, path in models.items()}
+    reference = next(iter(loaded))
+    label_ids = {label: int(i) for i, label in class_indices.items()}
+
+    stats = {name: {"top1_agreement": 0, "max_prob_delta": 0.0, "correct": 0} for name in loaded}
+    count = labelled = 0
+    for batch in _batches(iter_images(images_dir, limit), batch_size):
+        names, images = zip(*batch)
+        probs = {name: backend.predict(np.stack(images)) for name, backend in loaded.items()}
+        truth = [label_ids.get(name.split("/")[0]) for name in names]
+        count += len(names)
+        labelled += sum(t is not None for t in truth)
+        ref_top1 = probs[reference].argmax(axis=1)
+        for name, p in probs.items():
+            top1 = p.argmax(axis=1)
+            stats[name]["top1_agreement"] += int((top1 == ref_top1).sum())
+            stats[name]["max_prob_delta"] = max(stats[name]["max_prob_delta"], float(np.abs(p - probs[reference]).max()))
+            stats[name]["correct"] += sum(int(t == y) for t, y in zip(truth, top1) if t is not None)
+
+    report = {"reference": reference, "images": count, "labelled": labelled, "backends": {}}
+    for name, s in stats.items():
+        report["backends"][name] = {
+            "top1_agreement": s["top1_agreement"] / count if count else None,
+            "max_prob_delta": s["max_prob_delta"],
+            "accuracy": s["correct"] / labelled if labelled else None,
+        }
+    return report
@@ -1,34 +1,293 @@
 import os
+import sys
 import json
-from PIL import Image
+import argparse
 
 import numpy as np
-import tensorflow as tf
 # import streamlit as st # Streamlit is not needed for the Next.js API route
 
 working_dir = os.path.dirname(os.path.abspath(__file__))   # it provide absolute path for app directory
-model_path = f"{working_dir}/trained_model/plant_disease_Pred1.h5"
-# Load the pre-trained model
-model = tf.keras.models.load_model(model_path)
+model_path = os.environ.get("PLANT_DISEASE_MODEL", f"{working_dir}/trained_model/plant_disease_Pred1.h5")
+class_indices_path = os.environ.get("PLANT_DISEASE_CLASSES", f"{working_dir}/class_indices.json")
+
+IMAGE_SIZE = (224, 224)
+TOP_K = 3
+CASCADE_THRESHOLD = 0.9
+
+
+# Load the pre-trained model through an inference backend (keras, savedmodel or tflite, see backends.py);
+# only the chosen backend's runtime gets imported. With a cascade_model in front, that cheaper model
+# answers when it is confident enough and the full model only sees the rest (see cascade.py)
+def load_model(path=model_path, backend=None, num_threads=None, inter_op_threads=None,
+               cascade_model=None, cascade_threshold=CASCADE_THRESHOLD):
+   import backends
+   model = backends.load_backend(path, backend, num_threads, inter_op_threads)
+   if cascade_model:
+      import cascade
+      first = backends.load_backend(cascade_model, None, num_threads, inter_op_threads)
+      model = cascade.Cascade(first, model, cascade_threshold)
+   return model
+
 
 # loading the class names
-class_indices = json.load(open(f"{working_dir}/class_indices.json"))
+def load_class_indices(path=class_indices_path):
+   with open(path) as f:
+      return json.load(f)
+
+
+# Run one dummy batch so the first real request does not pay for graph tracing
+def warm_up(model):
+   run_model(model, np.zeros((1, *IMAGE_SIZE, 3), dtype=np.float32))
+   if hasattr(model, "routing"):
+      model.routing.reset()  # a cascade: the dummy batch is not traffic
+
+
+# Forward pass on an already preprocessed (N,224,224,3) batch, returns (N,classes) probabilities;
+# works for a backend as well as a plain Keras model (without its per-call progress bar)
+def run_model(model, batch):
+   import backends
+   if isinstance(model, backends.Backend):
+      return np.asarray(model.predict(batch))
+   return np.asarray(model.predict(batch, verbose=0))
+
+
+# Load and preprocess one image (path, file-like object or bytes) into a (224,224,3) float32 array,
+# the same way the server and the bulk scorer do (see preprocess.py);
+# pass a metrics.Trace to time the decode/convert/resize/normalize stages
+def preprocess_image(path, trace=None):
+   import preprocess
+   return preprocess.preprocess(path, trace)
+
+
+# Turn one row of probabilities into label, class id and the top-k classes
+def decode_prediction(probs, class_indices, top_k=TOP_K):
+   order = np.argsort(probs)[::-1][:top_k]
+   class_id = int(order[0])
+   return {
+      "label": class_indices[str(class_id)],
+      "class_id": class_id,
+      "top_k": [
+         {"label": class_indices[str(int(i))], "class_id": int(i), "probability": float(probs[i])}
+         for i in order
+      ],
+   }
+
+
+def read_bytes(path):
+   if hasattr(path, "read"):
+      return path.read()
+   with open(path, "rb") as f:
+      return f.read()
+
+
+# Prediction cache keyed by the image bytes and a fingerprint of the model and class files
+# (and of the preprocessing version, cascade model and threshold, which change the answers too)
+def open_cache(model_file=model_path, classes_file=class_indices_path, cache_mb=64, cache_db=None,
+               cascade_model=None, cascade_threshold=CASCADE_THRESHOLD, cache_db_rows=None):
+   import cache
+   import preprocess
+   salt = f"preprocess@{preprocess.VERSION}"
+   if cascade_model:
+      model_fingerprint = cache.fingerprint(model_file, cascade_model, classes_file,
+                                            salt=f"{salt}:cascade@{cascade_threshold}")
+   else:
+      model_fingerprint = cache.fingerprint(model_file, classes_file, salt=salt)
+   return cache.PredictionCache(model_fingerprint, int(cache_mb * 1024 * 1024), cache_db,
+                                cache_db_rows or cache.DEFAULT_DB_ROWS)
+
 
 # Function to Load and Preprocess the Image using Pillow
-def predict_class(model,path,class_indices):
-   img1 = Image.open(path)
-   img1 = img1.resize((224,224))
-   img1 = img1.convert('RGB')
-   img1 = np.array(img1)
-   img1 = img1 / 255.0  # optional depending on model preprocessing
+def predict_class(model,path,class_indices,cache=None,trace=None):
+   key = None
+   if cache is not None:
+      data = read_bytes(path)
+      key = cache.key(data)
+      y_p = cache.get(key)
+      if trace is not None:
+         trace.attrs["bytes"] = len(data)
+         trace.mark("cache_lookup")
+      if y_p is not None:
+         return class_indices[str(int(y_p.argmax()))]
+      path = data
+
+   img1 = preprocess_image(path, trace)
 
 # Add batch dimension ---> important step (1,224,224,3)
    img1 = np.expand_dims(img1, axis=0)
 # Predict
-   y_p = model.predict(img1)
+   y_p = run_model(model, img1)
+   if trace is not None:
+      trace.mark("predict")
+   if key is not None:
+      cache.put(key, y_p[0])
    y_predicted = y_p.argmax(axis=1)
    return class_indices[str(y_predicted[0])]
 
+
+def _cache_from_args(args):
+   if args.no_cache:
+      return None
+   return open_cache(args.model, args.classes, args.cache_mb, args.cache_db, args.cascade_model, args.cascade_threshold,
+                     args.cache_db_rows)
+
+
+def _load_model_from_args(args):
+   return load_model(args.model, args.backend, cascade_model=args.cascade_model, cascade_threshold=args.cascade_threshold)
+
+
+def _predict(args):
+   model = _load_model_from_args(args)
+   class_indices = load_class_indices(args.classes)
+   cache = _cache_from_args(args)
+   data = read_bytes(args.image)
+   key = cache.key(data) if cache is not None else None
+   probs = cache.get(key) if key is not None else None
+   if probs is None:
+      probs = run_model(model, np.expand_dims(preprocess_image(data), axis=0))[0]
+      if key is not None:
+         cache.put(key, probs)
+   print(json.dumps(decode_prediction(probs, class_indices, args.top_k)))
+
+
+def _serve(args):
+   import server
+   if args.workers and (args.max_wait_ms is not None or args.max_queue is not None):
+      sys.exit("--max-wait-ms and --max-queue only apply to the in-process batcher; with --workers the shared-memory "
+               "--slots bound the requests in flight and workers never wait to fill a batch")
+   server.serve(args.host, args.port, model_path=args.model, class_indices_path=args.classes, top_k=args.top_k,
+                backend=args.backend, max_batch_size=args.max_batch_size,
+                max_wait_ms=5.0 if args.max_wait_ms is None else args.max_wait_ms,
+                max_queue=256 if args.max_queue is None else args.max_queue,
+                cache=_cache_from_args(args), metrics_sample_rate=args.metrics_sample_rate,
+                profile_slowest=args.profile_slowest, profile_dir=args.profile_dir,
+                workers=args.workers, threads_per_worker=args.threads_per_worker, affinity=args.affinity,
+                slots=args.slots, cascade_model=args.cascade_model, cascade_threshold=args.cascade_threshold,
+                request_timeout=args.request_timeout, task_timeout=args.worker_timeout)
+
+
+def _score(args):
+   import scoring
+   model = _load_model_from_args(args)
+   class_indices = load_class_indices(args.classes)
+   summary = scoring.score(model, class_indices, args.input, args.out, args.batch_size, args.workers, args.top_k,
+                           cache=_cache_from_args(args))
+   if hasattr(model, "routing"):
+      summary["cascade"] = model.routing.stats()
+   print(json.dumps(summary))
+
+
+def _export(args):
+   import export
+   print(json.dumps(export.export(args.model, args.out_dir, args.calibration, args.calibration_count), indent=2))
+
+
+def _parity(args):
+   import export
+   models = dict(spec.split("=", 1) for spec in args.models)
+   report = export.parity_report(models, args.images, load_class_indices(args.classes), limit=args.limit)
+   print(json.dumps(report, indent=2))
+
+
+def _cascade_eval(args):
+   import cascade
+   if not args.cascade_model:
+      sys.exit("cascade-eval needs --cascade-model (the first-stage model to evaluate)")
+   first = load_model(args.cascade_model)
+   full = load_model(args.model, args.backend)
+   report = cascade.evaluate(first, full, args.images, load_class_indices(args.classes),
+                             args.thresholds or cascade.THRESHOLDS,
+                             args.batch_size, args.limit, args.max_accuracy_loss)
+   print(json.dumps(report, indent=2))
+
+
+def main(argv=None):
+   argv = sys.argv[1:] if argv is None else argv
+   # `python main.py <image>` is still accepted for the old one-shot route
+   if argv and os.path.isfile(argv[0]):
+      argv = ["predict", *argv]
+
+   parser = argparse.ArgumentParser(description="Plant disease predictor")
+   parser.add_argument("--model", default=model_path, help="path to the .h5 model, SavedModel directory or .tflite file")
+   parser.add_argument("--backend", choices=["keras", "savedmodel", "tflite"], default=os.environ.get("PLANT_DISEASE_BACKEND"),
+                       help="inference backend (default: inferred from --model)")
+   parser.add_argument("--classes", default=class_indices_path, help="path to class_indices.json")
+   parser.add_argument("--top-k", type=int, default=TOP_K, help="number of classes to report")
+   parser.add_argument("--cache-mb", type=float, default=64, help="size of the in-memory prediction cache")
+   parser.add_argument("--cache-db", help="SQLite file for a prediction cache shared between workers")
+   parser.add_argument("--cache-db-rows", type=int,
+                       help="rows kept in the --cache-db file, least recently used go first (default 500000)")
+   parser.add_argument("--no-cache", action="store_true", help="bypass the prediction cache (accuracy audits)")
+   parser.add_argument("--cascade-model", default=os.environ.get("PLANT_DISEASE_CASCADE_MODEL"),
+                       help="cheap first-stage model; the full --model only runs when it is unsure")
+   parser.add_argument("--cascade-threshold", type=float, default=CASCADE_THRESHOLD,
+                       help="top-1 probability at which the first-stage answer is kept")
+   commands = parser.add_subparsers(dest="command", required=True)
+
+   predict = commands.add_parser("predict", help="predict a single image and print JSON")
+   predict.add_argument("image")
+   predict.set_defaults(func=_predict)
+
+   serve = commands.add_parser("serve", help="keep the model loaded and serve /predict over HTTP")
+   serve.add_argument("--host", default="127.0.0.1")
+   serve.add_argument("--port", type=int, default=int(os.environ.get("PLANT_DISEASE_PORT", 5000)))
+   serve.add_argument("--max-batch-size", type=int, default=16, help="largest batch the scheduler forms")
+   serve.add_argument("--max-wait-ms", type=float,
+                      help="how long a request may wait for others to batch with (default 5; not with --workers)")
+   serve.add_argument("--max-queue", type=int,
+                      help="pending requests before new ones get HTTP 503 (default 256; not with --workers, see --slots)")
+   serve.add_argument("--request-timeout", type=float, default=60.0, help="seconds before a request gets HTTP 504")
+   serve.add_argument("--metrics-sample-rate", type=float, default=float(os.environ.get("PLANT_DISEASE_METRICS_SAMPLE", 0)),
+                      help="fraction of requests timed per stage and logged (0 = request counters only)")
+   serve.add_argument("--profile-slowest", type=int, default=0,
+                      help="keep the N slowest sampled requests, with cProfile dumps of their request thread "
+                           "(not the forward pass)")
+   serve.add_argument("--profile-dir", help="where slow-request profiles are written")
+   serve.add_argument("--workers", type=int, default=int(os.environ.get("PLANT_DISEASE_WORKERS", 0)),
+                      help="model worker processes fed through shared memory (0: run the model in this process)")
+   serve.add_argument("--threads-per-worker", type=int, default=int(os.environ.get("PLANT_DISEASE_THREADS_PER_WORKER", 1)),
+                      help="TensorFlow/TFLite threads in each worker")
+   serve.add_argument("--affinity", action="store_true", help="pin each worker to its own cores (Linux)")
+   serve.add_argument("--slots", type=int, help="shared-memory input slots, i.e. requests in flight before HTTP 503")
+   serve.add_argument("--worker-timeout", type=float, default=30.0,
+                      help="seconds a worker may hold requests without answering any before it is killed and restarted")
+   serve.set_defaults(func=_serve)
+
+   score = commands.add_parser("score", help="bulk-score a directory or .zip of images into JSONL/CSV")
+   score.add_argument("--input", required=True, help="directory or .zip archive of images")
+   score.add_argument("--out", required=True, help="results file (.jsonl or .csv), appended to and resumable")
+   score.add_argument("--batch-size", type=int, default=32)
+   score.add_argument("--workers", type=int, default=4, help="image decoding threads")
+   score.set_defaults(func=_score)
+
+   export = commands.add_parser("export", help="convert the Keras model to SavedModel, float TFLite and int8 TFLite")
+   export.add_argument("--out-dir", default=f"{working_dir}/trained_model/exported")
+   export.add_argument("--calibration", required=True, help="directory or .zip of images for int8 calibration")
+   export.add_argument("--calibration-count", type=int, default=200)
+   export.set_defaults(func=_export)
+
+   parity = commands.add_parser("parity", help="compare backends on a (labelled) image folder")
+   parity.add_argument("--images", required=True, help="image folder, optionally one sub-folder per class label")
+   parity.add_argument("--limit", type=int, help="only use the first N images")
+   parity.add_argument("models", nargs="+", metavar="NAME=PATH", help="models to compare, the first is the reference")
+   parity.set_defaults(func=_parity)
+
+   cascade_eval = commands.add_parser("cascade-eval", help="accuracy loss and compute saved by --cascade-model per threshold")
+   cascade_eval.add_argument("--images", required=True, help="image folder, one sub-folder per class label")
+   cascade_eval.add_argument("--limit", type=int, help="only use the first N images")
+   cascade_eval.add_argument("--batch-size", type=int, default=32)
+   cascade_eval.add_argument("--thresholds", type=lambda v: [float(t) for t in v.split(",") if t],
+                             help="comma-separated thresholds to try (default: 0.5 to 0.99)")
+   cascade_eval.add_argument("--max-accuracy-loss", type=float, default=0.01,
+                             help="largest accuracy loss the recommended threshold may cost")
+   cascade_eval.set_defaults(func=_cascade_eval)
+
+   args = parser.parse_args(argv)
+   args.func(args)
+
+
+if __name__ == "__main__":
+   main()
+
 # The Streamlit app part will be removed as we are creating a Next.js API route
 # st.title('🌿Plant Disease Predictor🔍')
 # uploaded_image = st.file_uploader("Upload an image...", type=["jpg", "jpeg", "png"])
@@ -41,4 +300,4 @@ def predict_class(model,path,class_indices):
 #     with col2:
 #         if st.button('Predict'):
 #             prediction = predict_class(model,uploaded_image,class_indices)
-#             st.success(f'Prediction: {str(prediction)}')
\ No newline at end of file
+#             st.success(f'Prediction: {str(prediction)}')
@@ -0,0 +1,233 @@
+"""Opt-in per-stage timing, Prometheus-text metrics and slow-request profiles.
+
+A ``Trace`` follows one request: code on the hot path calls
+``trace.mark(stage)`` to book the time since the previous mark to ``stage``
+and does nothing when handed ``None``.  ``Metrics.start`` only returns a
+trace for a ``sample_rate`` fraction of requests, so unsampled requests pay
+for nothing but a random draw.  Finished traces feed the histograms behind
+``/metrics`` and one JSON log line each.  With ``profile_slowest=N`` the N
+slowest sampled requests are kept for ``/debug/slowest``.  Sampled requests
+also run under cProfile, one at a time, and a kept request carries its
+profile when it had one.  A profile covers the request's own thread only:
+reading the body, decoding, the cache and waiting for the answer.  The forward
+pass runs on the batching thread or in a worker process; it shows up as the
+``queue_wait`` and ``predict`` stage times, and in the profile only as a
+``Future`` wait.
+"""
+import bisect
+import collections
+import cProfile
+import heapq
+import itertools
+import json
+import logging
+import os
+import random
+import tempfile
+import threading
+import time
+
+log = logging.getLogger("plantdisease")
+
+SECONDS_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+PIXEL_BUCKETS = (256, 512, 1024, 2048, 4096, 8192)
+BYTES_BUCKETS = (32e3, 128e3, 512e3, 1e6, 2e6, 4e6, 8e6, 16e6)
+BATCH_BUCKETS = (1, 2, 4, 8, 16, 32, 64)
+
+
+class Trace:
+
+    def __init__(self):
+        self.start = self._last = time.perf_counter()
+        self.stages = {}
+        self.attrs = {}
+        self.profile = None
+
+    def mark(self, stage):
+        now = time.perf_counter()
+        self.stages[stage] = self.stages.get(stage, 0.0) + now - self._last
+        self._last = now
+
+    def skip(self):
+        """Restart the stage clock without booking the time since the last mark."""
+        self._last = time.perf_counter()
+
+    def add(self, stage, seconds):
+        """Book a duration measured elsewhere (e.g. on the batching thread)."""
+        self.stages[stage] = self.stages.get(stage, 0.0) + seconds
+
+    def finish(self):
+        self.stages["total"] = time.perf_counter() - self.start
+        return self.stages["total"]
+
+
+class Histogram:
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value, n=1):
+        self.counts[bisect.bisect_left(self.buckets, value)] += n
+        self.sum += value * n
+        self.count += n
+
+    def render(self, name, labels=""):
+        sep = "," if labels else ""
+        lines, cumulative = [], 0
+        for bound, count in zip(self.buckets, self.counts):
+            cumulative += count
+            lines.append(f'{name}_bucket{{{labels}{sep}le="{bound:g}"}} {cumulative}')
+        lines.append(f'{name}_bucket{{{labels}{sep}le="+Inf"}} {self.count}')
+        suffix = f"{{{labels}}}" if labels else ""
+        lines.append(f"{name}_sum{suffix} {self.sum:g}")
+        lines.append(f"{name}_count{suffix} {self.count}")
+        return lines
+
+
+def _family(name, kind, help_text, lines):
+    return [f"# HELP {name} {help_text}", f"# TYPE {name} {kind}", *lines]
+
+
+class Metrics:
+
+    def __init__(self, sample_rate=0.0, profile_slowest=0, profile_dir=None):
+        self.sample_rate = sample_rate
+        self.profile_slowest = profile_slowest
+        self.profile_dir = profile_dir
+        if profile_slowest and not profile_dir:
+            self.profile_dir = tempfile.mkdtemp(prefix="plantdisease-profiles-")
+        self._lock = threading.Lock()
+        self._stages = collections.defaultdict(lambda: Histogram(SECONDS_BUCKETS))
+        self._pixels = {"width": Histogram(PIXEL_BUCKETS), "height": Histogram(PIXEL_BUCKETS)}
+        self._bytes = Histogram(BYTES_BUCKETS)
+        self._requests = collections.Counter()
+        self._slowest = []  # min-heap of (total seconds, seq, record)
+        self._seq = itertools.count()
+        # cProfile can only profile one request at a time (one active profiler per process on 3.12+)
+        self._profiling = threading.Lock()
+        if profile_slowest:
+            os.makedirs(self.profile_dir, exist_ok=True)
+
+    def start(self):
+        """A Trace for a sampled request, else None."""
+        if not self.sample_rate or random.random() >= self.sample_rate:
+            return None
+        trace = Trace()
+        if self.profile_slowest and self._profiling.acquire(blocking=False):
+            trace.profile = cProfile.Profile()
+            try:
+                trace.profile.enable()
+            except ValueError:  # another profiler (e.g. a debugger) is active
+                trace.profile = None
+                self._profiling.release()
+        return trace
+
+    def count(self, status):
+        with self._lock:
+            self._requests[status] += 1
+
+    def record(self, trace, **fields):
+        """Finish ``trace``: update histograms, keep it if among the slowest, and log one line."""
+        total = trace.finish()
+        if trace.profile is not None:
+            trace.profile.disable()
+            self._profiling.release()
+        record = {
+            "event": "predict",
+            **{f"{stage}_ms": round(seconds * 1000, 3) for stage, seconds in trace.stages.items()},
+            **trace.attrs,
+            **fields,
+        }
+        with self._lock:
+            for stage, seconds in trace.stages.items():
+                self._stages[stage].observe(seconds)
+            if "width" in trace.attrs:
+                self._pixels["width"].observe(trace.attrs["width"])
+                self._pixels["height"].observe(trace.attrs["height"])
+            if "bytes" in trace.attrs:
+                self._bytes.observe(trace.attrs["bytes"])
+            if self.profile_slowest:
+                self._keep_if_slow(total, trace.profile, record)
+        log.info(json.dumps(record))
+
+    def _keep_if_slow(self, total, profile, record):
+        # Every sampled request competes, not only the profiled ones: the slowest often
+        # arrive together in a burst while another request holds the profiler
+        if len(self._slowest) >= self.profile_slowest and total <= self._slowest[0][0]:
+            return
+        seq = next(self._seq)
+        entry = (total, seq, dict(record))
+        if profile is not None:
+            entry[2]["profile"] = os.path.join(self.profile_dir, f"slow_{seq}_{total * 1000:.0f}ms.prof")
+            profile.dump_stats(entry[2]["profile"])
+        if len(self._slowest) < self.profile_slowest:
+            heapq.heappush(self._slowest, entry)
+        else:
+            _, _, dropped = heapq.heapreplace(self._slowest, entry)
+            if "profile" in dropped and os.path.exists(dropped["profile"]):
+                os.remove(dropped["profile"])
+
+    def slowest(self):
+        with self._lock:
+            return [record for _, _, record in sorted(self._slowest, reverse=True)]
+
+    def render(self, batcher=None, cache=None, routing=None):
+        """The Prometheus text exposition of everything collected so far."""
+        with self._lock:
+            lines = _family("plantdisease_requests_total", "counter", "Prediction requests by HTTP status",
+                            [f'plantdisease_requests_total{{status="{s}"}} {n}' for s, n in sorted(self._requests.items())])
+            stage_lines = []
+            for stage, hist in sorted(self._stages.items()):
+                stage_lines += hist.render("plantdisease_stage_seconds", f'stage="{stage}"')
+            lines += _family("plantdisease_stage_seconds", "histogram", "Time per request stage (sampled requests)",
+                             stage_lines)
+            pixel_lines = []
+            for dim, hist in self._pixels.items():
+                pixel_lines += hist.render("plantdisease_image_pixels", f'dim="{dim}"')
+            lines += _family("plantdisease_image_pixels", "histogram", "Uploaded image width/height (sampled requests)",
+                             pixel_lines)
+            lines += _family("plantdisease_image_bytes", "histogram", "Uploaded image size (sampled requests)",
+                             self._bytes.render("plantdisease_image_bytes"))
+
+        if batcher is not None:
+            stats = batcher.stats()
+            sizes = Histogram(BATCH_BUCKETS)
+            for size, count in stats["batch_sizes"].items():
+                sizes.observe(size, count)
+            lines += _family("plantdisease_batch_size", "histogram", "Images per forward pass",
+                             sizes.render("plantdisease_batch_size"))
+            lines += _family("plantdisease_queue_depth", "gauge", "Requests waiting for a batch",
+                             [f"plantdisease_queue_depth {stats['queue_depth']}"])
+            lines += _family("plantdisease_queue_rejected_total", "counter", "Requests rejected with a full queue",
+                             [f"plantdisease_queue_rejected_total {stats['rejected']}"])
+            if "workers" in stats:
+                lines += _family("plantdisease_worker_restarts_total", "counter", "Model worker processes restarted",
+                                 [f'plantdisease_worker_restarts_total{{worker="{w["id"]}"}} {w["restarts"]}'
+                                  for w in stats["workers"]])
+                lines += _family("plantdisease_worker_in_flight", "gauge", "Requests dispatched to each model worker",
+                                 [f'plantdisease_worker_in_flight{{worker="{w["id"]}"}} {w["in_flight"]}'
+                                  for w in stats["workers"]])
+        if routing is not None:
+            stats = routing.stats()
+            lines += _family("plantdisease_cascade_images_total", "counter", "Images answered by each cascade stage",
+                             [f'plantdisease_cascade_images_total{{stage="first"}} {stats["first_stage"]}',
+                              f'plantdisease_cascade_images_total{{stage="full"}} {stats["full_model"]}'])
+            lines += _family("plantdisease_cascade_seconds_total", "counter", "Forward-pass time in each cascade stage",
+                             [f'plantdisease_cascade_seconds_total{{stage="first"}} {stats["first_stage_seconds"]:g}',
+                              f'plantdisease_cascade_seconds_total{{stage="full"}} {stats["full_model_seconds"]:g}'])
+            lines += _family("plantdisease_cascade_threshold", "gauge", "Top-1 probability the first stage must reach",
+                             [f"plantdisease_cascade_threshold {stats['threshold']:g}"])
+        if cache is not None:
+            stats = cache.stats()
+            lines += _family("plantdisease_cache_total", "counter", "Prediction cache lookups by result",
+                             [f'plantdisease_cache_total{{result="{r}"}} {stats[r]}'
+                              for r in ("hits", "disk_hits", "misses", "evictions", "disk_evictions", "bypassed")])
+            lines += _family("plantdisease_cache_bytes", "gauge", "Bytes held by the in-memory cache",
+                             [f"plantdisease_cache_bytes {stats['bytes']}"])
+            if stats["max_disk_rows"] is not None:
+                lines += _family("plantdisease_cache_disk_rows", "gauge", "Rows in the shared SQLite cache (last check)",
+                                 [f"plantdisease_cache_disk_rows {stats['disk_rows']}"])
+        return "\n".join(lines) + "\n"
@@ -0,0 +1,449 @@
+"""Multi-process model workers fed through shared memory.
+
+The front process (the HTTP server) decodes each upload straight into a free
+slot of one ``multiprocessing.shared_memory`` block of (slots,224,224,3)
+float32 tensors and sends only ``(request id, slot)`` to a worker.  Each
+worker maps the same block, reads its slots without copying (a batch of
+several non-adjacent slots is gathered with one copy), runs the model with
+its own thread budget and optional CPU affinity, and sends back just the
+probability rows over a pipe of its own.
+
+A monitor thread restarts any worker that dies, backing off exponentially
+while it keeps crashing.  The requests it had taken are still in their slots,
+so they are re-dispatched rather than dropped.  Because any of them may have
+caused the crash, they are retried one at a time, each alone on a worker, and
+a request that keeps killing workers fails after ``MAX_REDISPATCHES``
+retries.  A worker that holds requests but answers none of them for
+``task_timeout`` seconds (a forward pass stuck in native code) is killed, which
+recovers its requests the same way.  A worker that dies
+before it was ever ready (bad model path, missing runtime) fails startup.
+Running out of free slots is the pool's backpressure and raises
+``QueueFullError`` like the in-process micro-batcher.  In cascade mode the
+workers also report which stage answered each batch.
+"""
+import collections
+import itertools
+import logging
+import multiprocessing as mp
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from multiprocessing import connection, shared_memory
+
+import numpy as np
+
+import main
+import preprocess
+from batching import QueueFullError
+from cascade import Routing
+
+log = logging.getLogger("plantdisease")
+
+SLOT_SHAPE = (*main.IMAGE_SIZE, 3)
+RESTART_DELAY = 1.0
+MAX_RESTART_DELAY = 30.0
+MAX_REDISPATCHES = 2
+PARENT_CHECK_INTERVAL = 1.0
+TASK_TIMEOUT = 30.0
+
+
+def _attach(name):
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)  # Python 3.13+
+    except TypeError:
+        # Older Pythons register the block again with the resource tracker the
+        # workers share with the front process; that is harmless, and the front
+        # process's unlink() on close removes the one registration
+        return shared_memory.SharedMemory(name=name)
+
+
+def _worker_main(worker_id, shm_name, slots, tasks, results, model_path, backend, threads, cpus, max_batch,
+                 cascade_model, cascade_threshold, loader):
+    if cpus and hasattr(os, "sched_setaffinity"):
+        os.sched_setaffinity(0, cpus)
+    shm = _attach(shm_name)
+    images = np.ndarray((slots, *SLOT_SHAPE), dtype=np.float32, buffer=shm.buf)
+    model = loader(model_path, backend, threads, inter_op_threads=1,
+                   cascade_model=cascade_model, cascade_threshold=cascade_threshold)
+    main.warm_up(model)
+    results.send(("ready", worker_id, None, None, 0.0, None))
+
+    parent = mp.parent_process()
+    running = True
+    while running:
+        try:
+            task = tasks.get(timeout=PARENT_CHECK_INTERVAL)
+        except queue.Empty:
+            # Exit with a dead front process so the shared block can be cleaned up
+            if parent is not None and not parent.is_alive():
+                break
+            continue
+        if task is None:
+            break
+        batch = [task]
+        while len(batch) < max_batch:
+            try:
+                task = tasks.get_nowait()
+            except queue.Empty:
+                break
+            if task is None:
+                running = False
+                break
+            batch.append(task)
+
+        # Requests that were with a crashed worker run on their own, so a request
+        # that kills the worker does not take healthy batch mates down with it
+        groups = [[(i, s) for i, s, suspect in batch if not suspect]]
+        groups += [[(i, s)] for i, s, suspect in batch if suspect]
+        for group in groups:
+            if group:
+                _run_group(model, images, group, results, worker_id, cascade_model)
+    del images
+    shm.close()
+
+
+def _run_group(model, images, group, results, worker_id, cascade_model):
+    ids, slot_ids = zip(*group)
+    # A single slot is a zero-copy view; several are gathered into one array
+    inputs = images[slot_ids[0]:slot_ids[0] + 1] if len(slot_ids) == 1 else images[list(slot_ids)]
+    start = time.perf_counter()
+    try:
+        probs = main.run_model(model, inputs)
+    except Exception as e:
+        results.send(("error", worker_id, ids, f"{type(e).__name__}: {e}", 0.0, None))
+        return
+    routing = model.last_routing if cascade_model else None
+    results.send(("result", worker_id, ids, probs, time.perf_counter() - start, routing))
+
+
+class _Task:
+    __slots__ = ("slot", "future", "trace", "worker", "dispatched", "crashes")
+
+    def __init__(self, slot, future, trace):
+        self.slot = slot
+        self.future = future
+        self.trace = trace
+        self.worker = None
+        self.dispatched = None
+        self.crashes = 0  # workers that died while holding this request
+
+
+class _Worker:
+
+    def __init__(self, worker_id, cpus):
+        self.id = worker_id
+        self.cpus = cpus
+        self.process = None
+        self.tasks = None
+        self.results = None
+        self.ready = False
+        self.started = False  # has been ready at least once
+        self.restart_at = None  # set while dead and waiting to be restarted
+        self.crashes = 0  # consecutive crashes without a result in between, for the backoff
+        self.restarts = 0
+        self.completed = 0
+        self.last_answer = 0.0  # perf_counter of the latest result or error, for hang detection
+        self.killed = False  # by the monitor for hanging
+        self.hangs = 0
+
+
+class WorkerPool:
+
+    def __init__(self, model_path=main.model_path, backend=None, workers=2, threads_per_worker=1,
+                 affinity=False, max_batch_size=8, slots=None, cascade_model=None,
+                 cascade_threshold=main.CASCADE_THRESHOLD, task_timeout=TASK_TIMEOUT, loader=main.load_model):
+        """``loader`` is called in each worker with ``main.load_model``'s arguments; it must be picklable."""
+        self.model_path = model_path
+        self.loader = loader
+        self.backend = backend
+        self.cascade_model = cascade_model
+        self.cascade_threshold = cascade_threshold
+        self.routing = Routing(cascade_threshold) if cascade_model else None
+        self.threads_per_worker = threads_per_worker
+        self.max_batch_size = max_batch_size
+        self.task_timeout = task_timeout
+        self.slots = slots or max(32, workers * max_batch_size * 2)
+        self._ctx = mp.get_context("spawn")  # fork is unsafe once TensorFlow threads exist
+        self._shm = shared_memory.SharedMemory(create=True, size=self.slots * int(np.prod(SLOT_SHAPE)) * 4)
+        self.images = np.ndarray((self.slots, *SLOT_SHAPE), dtype=np.float32, buffer=self._shm.buf)
+        self._free = queue.Queue()
+        for slot in range(self.slots):
+            self._free.put(slot)
+        self._lock = threading.Lock()
+        self._pending = {}
+        self._suspects = collections.deque()  # (id, task) that were with a crashed worker
+        self._probing = None  # id of the suspect currently running on its own
+        self._ids = itertools.count()
+        self.batch_sizes = collections.Counter()
+        self.rejected = 0
+        self._closing = False
+        self.failed = None
+
+        if affinity and not hasattr(os, "sched_setaffinity"):
+            log.warning("CPU affinity is not supported on this platform, ignoring")
+            affinity = False
+        # Consecutive blocks of the cores this process may use (a container may not get 0..n-1)
+        allowed = sorted(os.sched_getaffinity(0)) if affinity else []
+        self._workers = []
+        for i in range(workers):
+            cpus = None
+            if affinity:
+                cpus = {allowed[(i * threads_per_worker + t) % len(allowed)] for t in range(threads_per_worker)}
+            self._workers.append(_Worker(i, cpus))
+
+        for worker in self._workers:
+            self._start(worker)
+        self._collector = threading.Thread(target=self._collect, name="pool-collector", daemon=True)
+        self._collector.start()
+        self._monitor = threading.Thread(target=self._watch, name="pool-monitor", daemon=True)
+        self._monitor.start()
+
+    # ---- front side ------------------------------------------------------------------------------
+
+    def wait_ready(self, timeout=None):
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while not all(w.ready for w in self._workers):
+            if self.failed:
+                raise RuntimeError(self.failed)
+            if deadline is not None and time.monotonic() > deadline:
+                raise TimeoutError(f"model workers did not start within {timeout:g}s")
+            time.sleep(0.05)
+
+    def submit(self, data, trace=None):
+        """Decode ``data`` into a free slot and dispatch it; returns a Future of the probability row."""
+        try:
+            slot = self._free.get_nowait()
+        except queue.Empty:
+            with self._lock:
+                self.rejected += 1
+            raise QueueFullError(f"all {self.slots} input slots are in use")
+        try:
+            preprocess.preprocess_into(data, self.images[slot], trace)
+        except Exception:
+            self._free.put(slot)
+            raise
+        task = _Task(slot, Future(), trace)
+        with self._lock:
+            task_id = next(self._ids)
+            self._pending[task_id] = task
+            self._dispatch(task_id, task)
+        return task.future
+
+    def predict(self, data, timeout=None, trace=None):
+        return self.submit(data, trace).result(timeout)
+
+    def stats(self):
+        with self._lock:
+            sizes = dict(sorted(self.batch_sizes.items()))
+            load = self._load()
+            workers = [
+                {"id": w.id, "pid": w.process.pid if w.process else None, "ready": w.ready, "in_flight": load[w],
+                 "completed": w.completed, "restarts": w.restarts, "hangs": w.hangs,
+                 "cpus": sorted(w.cpus) if w.cpus else None}
+                for w in self._workers
+            ]
+            queue_depth = len(self._pending)
+            rejected = self.rejected
+        batches = sum(sizes.values())
+        images = sum(size * count for size, count in sizes.items())
+        return {
+            "batches": batches,
+            "images": images,
+            "mean_batch_size": images / batches if batches else 0.0,
+            "batch_sizes": sizes,
+            "queue_depth": queue_depth,
+            "rejected": rejected,
+            "free_slots": self._free.qsize(),
+            "workers": workers,
+        }
+
+    def close(self):
+        self._closing = True
+        for worker in self._workers:
+            if worker.process is not None and worker.process.is_alive():
+                worker.tasks.put(None)
+        for worker in self._workers:
+            if worker.process is not None:
+                worker.process.join(timeout=10)
+                if worker.process.is_alive():
+                    worker.process.terminate()
+        self._collector.join(timeout=5)
+        del self.images
+        self._shm.close()
+        self._shm.unlink()
+
+    # ---- internals -------------------------------------------------------------------------------
+
+    def _start(self, worker):
+        worker.ready = False
+        worker.tasks = self._ctx.Queue()
+        # A pipe of its own rather than one shared results queue: a worker killed while writing
+        # would hold the shared queue's write lock forever and block every other worker
+        results, sender = self._ctx.Pipe(duplex=False)
+        worker.process = self._ctx.Process(
+            target=_worker_main,
+            args=(worker.id, self._shm.name, self.slots, worker.tasks, sender, self.model_path,
+                  self.backend, self.threads_per_worker, worker.cpus, self.max_batch_size, self.cascade_model,
+                  self.cascade_threshold, self.loader),
+            name=f"model-worker-{worker.id}",
+            daemon=True,
+        )
+        worker.process.start()
+        sender.close()  # the worker holds the only write end, so its death reads as EOF
+        worker.results = results
+
+    def _load(self):
+        # Caller holds self._lock; there are at most `slots` pending tasks
+        load = dict.fromkeys(self._workers, 0)
+        for task in self._pending.values():
+            if task.worker is not None:
+                load[task.worker] += 1
+        return load
+
+    def _dispatch(self, task_id, task):
+        # Caller holds self._lock. Prefer ready workers, then the one not running a suspect, then the least loaded.
+        task.worker = None
+        load = self._load()
+        probe = self._pending.get(self._probing)
+        probing = probe.worker if probe is not None else None
+        worker = min(self._workers, key=lambda w: (w.restart_at is not None, not w.ready, w is probing, load[w]))
+        task.worker = worker
+        task.dispatched = time.perf_counter()
+        worker.tasks.put((task_id, task.slot, task.crashes > 0))
+
+    def _collect(self):
+        listening = {}  # result pipe -> worker, including pipes of dead workers not yet drained
+        while not self._closing:
+            for worker in self._workers:
+                results = worker.results
+                if results is not None and not results.closed:  # closed: dead and drained, not restarted yet
+                    listening.setdefault(results, worker)
+            for conn in connection.wait(list(listening), timeout=PARENT_CHECK_INTERVAL):
+                try:
+                    message = conn.recv()
+                except Exception:
+                    # EOF, or a message cut short by the worker dying; the monitor restarts it
+                    del listening[conn]
+                    conn.close()
+                    continue
+                self._handle(listening[conn], message)
+        for conn in listening:
+            conn.close()
+
+    def _handle(self, worker, message):
+        kind, worker_id, ids, payload, seconds, routing = message
+        worker.last_answer = time.perf_counter()
+        if kind == "ready":
+            worker.ready = worker.started = True
+            return
+        if kind == "result":
+            worker.crashes = 0
+        if routing is not None:
+            self.routing.record(*routing)
+        done = []
+        with self._lock:
+            if kind == "result":
+                self.batch_sizes[len(ids)] += 1
+            for i, task_id in enumerate(ids):
+                # A re-dispatched task may be answered twice; the first answer wins
+                task = self._pending.pop(task_id, None)
+                if task is None:
+                    continue
+                if task_id == self._probing:
+                    self._probing = None
+                worker.completed += 1
+                done.append((i, task))
+            self._probe()
+        now = time.perf_counter()
+        for i, task in done:
+            self._free.put(task.slot)
+            if kind == "error":
+                task.future.set_exception(RuntimeError(payload))
+                continue
+            if task.trace is not None:
+                task.trace.add("queue_wait", max(0.0, now - task.dispatched - seconds))
+                task.trace.add("predict", seconds)
+                task.trace.attrs["batch_size"] = len(ids)
+                task.trace.attrs["worker"] = worker_id
+            task.future.set_result(payload[i])
+
+    def _watch(self):
+        while not self._closing:
+            time.sleep(0.5)
+            for worker in self._workers:
+                if self._closing:
+                    continue
+                if worker.process.is_alive():
+                    self._check_hung(worker)
+                    continue
+                if worker.restart_at is None:
+                    if not worker.started:
+                        self.failed = (f"model worker {worker.id} exited with {worker.process.exitcode} "
+                                       "before it was ready, see its error above")
+                        log.error(self.failed)
+                        return
+                    worker.ready = False
+                    worker.crashes += 1
+                    delay = min(RESTART_DELAY * 2 ** (worker.crashes - 1), MAX_RESTART_DELAY)
+                    worker.restart_at = time.monotonic() + delay
+                    log.warning("model worker %d (pid %d) %s, restarting in %gs", worker.id, worker.process.pid,
+                                "was killed for hanging" if worker.killed else f"exited with {worker.process.exitcode}",
+                                delay)
+                    worker.killed = False
+                    with self._lock:
+                        self._redispatch(worker, crashed=True)
+                elif time.monotonic() >= worker.restart_at:
+                    with self._lock:
+                        worker.restarts += 1
+                        worker.restart_at = None
+                        self._start(worker)
+                        # Requests that had nowhere else to go waited for this worker
+                        self._redispatch(worker, crashed=False)
+
+    def _check_hung(self, worker):
+        # A worker that holds requests is hung once it has answered none of them for task_timeout
+        # seconds, counted from its last answer or from the oldest request it holds, whichever is later
+        if not worker.ready or worker.killed:
+            return
+        with self._lock:
+            held = [task.dispatched for task in self._pending.values() if task.worker is worker]
+        if not held:
+            return
+        waited = time.perf_counter() - max(worker.last_answer, min(held))
+        if waited > self.task_timeout:
+            log.error("model worker %d (pid %d) answered none of its %d requests in %.0fs, killing it",
+                      worker.id, worker.process.pid, len(held), waited)
+            worker.killed = True
+            worker.hangs += 1
+            worker.process.kill()
+
+    def _redispatch(self, worker, crashed):
+        # Caller holds self._lock. The worker's queued and in-flight requests are still in
+        # their slots; hand them out again unless they have already outlived too many crashes.
+        for task_id, task in [(i, t) for i, t in self._pending.items() if t.worker is worker]:
+            if crashed:
+                task.crashes += 1
+                if task_id == self._probing:
+                    self._probing = None
+            if task.crashes > MAX_REDISPATCHES:
+                del self._pending[task_id]
+                self._free.put(task.slot)
+                task.future.set_exception(
+                    RuntimeError(f"model workers crashed or hung {task.crashes} times while running this request"))
+            elif task.crashes and task_id != self._probing:
+                task.worker = None
+                self._suspects.append((task_id, task))
+            else:
+                self._dispatch(task_id, task)
+        self._probe()
+
+    def _probe(self):
+        # Caller holds self._lock. Suspects run one at a time, alone, on a worker that gets no
+        # new requests meanwhile, so the next crash is blamed on the request that caused it.
+        while self._probing is None and self._suspects:
+            task_id, task = self._suspects.popleft()
+            if task_id in self._pending:  # not answered by a late result in the meantime
+                self._probing = task_id
+                self._dispatch(task_id, task)
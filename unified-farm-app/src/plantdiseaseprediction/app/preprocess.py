@@ -0,0 +1,89 @@
+"""Fast image preprocessing into reusable float32 batch buffers.
+
+This is the only preprocessing path: the ``predict`` CLI, ``predict_class``,
+the server, the bulk scorer and the export/cascade tools all use it, so one
+photo gets the same input everywhere.  Compared with the original
+``main.preprocess_image`` (kept as the reference in
+``benchmarks/preprocess_bench.py``) this
+
+* asks the JPEG decoder for a reduced-size decode (``Image.draft``) so a
+  12 MP photo is decoded at 1/2 .. 1/8 scale, never below twice the model
+  input size, before the final bicubic resize to 224x224;
+* applies the EXIF orientation tag, which the reference path ignores;
+* converts to RGB once, before resizing;
+* scales uint8 -> float32 straight into a caller-provided buffer instead
+  of building a float64 array and a batch copy.
+
+Tolerance: for images without an EXIF rotation the result differs from the
+reference by a mean absolute error below 0.005 and a max absolute error
+below 0.05 (on the 0..1 scale); images that need no resize match to float32
+rounding.  ``benchmarks/preprocess_bench.py`` re-checks this and, given a
+model, the top-1 agreement between the two paths.
+"""
+import io
+
+import numpy as np
+from PIL import Image, ImageOps
+
+IMAGE_SIZE = (224, 224)
+# Decode JPEGs no smaller than this multiple of the target so the final resize still antialiases
+DRAFT_FACTOR = 2
+
+# Part of the prediction cache fingerprint; bump it when the output of ``preprocess`` changes
+VERSION = 2
+
+_SCALE = np.float32(255.0)
+_ORIENTATION = 0x0112
+
+
+def load_image(source, size=IMAGE_SIZE, trace=None):
+    """Open ``source`` (path, file object or bytes) as an upright RGB image of ``size``."""
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        source = io.BytesIO(source)
+    img = Image.open(source)
+    if trace is not None:
+        trace.attrs["width"], trace.attrs["height"] = img.size
+    if img.format == "JPEG":
+        img.draft("RGB", (size[0] * DRAFT_FACTOR, size[1] * DRAFT_FACTOR))
+    img.load()
+    if trace is not None:
+        trace.mark("decode")
+    if img.getexif().get(_ORIENTATION, 1) != 1:
+        img = ImageOps.exif_transpose(img)
+    if img.mode != "RGB":
+        img = img.convert("RGB")
+    if trace is not None:
+        trace.mark("convert")
+    if img.size != size:
+        img = img.resize(size, Image.BICUBIC, reducing_gap=3.0)
+    if trace is not None:
+        trace.mark("resize")
+    return img
+
+
+def preprocess_into(source, out, trace=None):
+    """Decode ``source`` and write it, scaled to 0..1, into the (224,224,3) float32 array ``out``."""
+    img = load_image(source, (out.shape[1], out.shape[0]), trace)
+    np.divide(np.asarray(img), _SCALE, out=out)
+    if trace is not None:
+        trace.mark("normalize")
+    return out
+
+
+def preprocess(source, trace=None):
+    """Convenience wrapper returning a freshly allocated (224,224,3) float32 array."""
+    return preprocess_into(source, np.empty((*IMAGE_SIZE, 3), dtype=np.float32), trace)
+
+
+class BatchBuffer:
+    """A preallocated (batch_size,224,224,3) float32 array filled slot by slot."""
+
+    def __init__(self, batch_size, size=IMAGE_SIZE):
+        self.size = batch_size
+        self.array = np.empty((batch_size, size[1], size[0], 3), dtype=np.float32)
+
+    def fill(self, index, source):
+        return preprocess_into(source, self.array[index])
+
+    def view(self, count):
+        return self.array[:count]
@@ -0,0 +1,203 @@
+"""Streaming bulk scoring of a directory or .zip archive of leaf images.
+
+A thread pool decodes the next batch of images straight into one of two
+reusable float32 buffers while the model scores the other, and every
+result is appended to the output (JSONL or CSV) as soon as its batch
+finishes, so memory stays flat however many files there are.  Files already present in the output are
+skipped, which makes an interrupted run resumable (a half-written last line
+is cut off first, so the file it named is scored again); unreadable images are
+recorded with an ``error`` and do not stop the run.  With a
+``PredictionCache`` images seen before (even under another file name) are
+answered from the cache without being decoded.
+"""
+import collections
+import csv
+import json
+import os
+import sys
+import time
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+
+import main
+import preprocess
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp", ".webp", ".tif", ".tiff")
+CSV_FIELDS = ["file", "label", "class_id", "probability", "error"]
+
+
+def _read_file(path):
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def iter_sources(input_path):
+    """Yield ``(name, read)`` pairs where ``read()`` returns the image bytes."""
+    if zipfile.is_zipfile(input_path):
+        archive = zipfile.ZipFile(input_path)
+        for info in archive.infolist():
+            if not info.is_dir() and info.filename.lower().endswith(IMAGE_EXTENSIONS):
+                yield info.filename, lambda name=info.filename: archive.read(name)
+        return
+
+    for root, dirs, files in os.walk(input_path):
+        dirs.sort()
+        for filename in sorted(files):
+            if filename.lower().endswith(IMAGE_EXTENSIONS):
+                path = os.path.join(root, filename)
+                name = os.path.relpath(path, input_path).replace(os.sep, "/")
+                yield name, lambda path=path: _read_file(path)
+
+
+def _is_csv(out_path):
+    return out_path.lower().endswith(".csv")
+
+
+def _drop_partial_line(out_path):
+    """Cut a half-written last line left by an interrupted run so appending starts on a fresh line."""
+    if not os.path.exists(out_path):
+        return
+    with open(out_path, "rb+") as f:
+        end = pos = f.seek(0, os.SEEK_END)
+        while pos > 0:
+            step = min(pos, 64 * 1024)
+            f.seek(pos - step)
+            chunk = f.read(step)
+            if pos == end and chunk.endswith(b"\n"):
+                return
+            newline = chunk.rfind(b"\n")
+            if newline >= 0:
+                f.truncate(pos - step + newline + 1)
+                return
+            pos -= step
+        f.truncate(0)  # not even a CSV header made it; start over
+
+
+def load_done(out_path):
+    """Names already written to ``out_path`` by a previous run."""
+    if not os.path.exists(out_path):
+        return set()
+    with open(out_path, newline="") as f:
+        if _is_csv(out_path):
+            return {row["file"] for row in csv.DictReader(f)}
+        done = set()
+        for line in f:
+            try:
+                done.add(json.loads(line)["file"])
+            except (ValueError, KeyError):
+                pass  # not a result line
+        return done
+
+
+class ResultWriter:
+
+    def __init__(self, out_path):
+        self.csv = _is_csv(out_path)
+        new_file = not os.path.exists(out_path) or os.path.getsize(out_path) == 0
+        self._f = open(out_path, "a", newline="")
+        if self.csv:
+            self._writer = csv.DictWriter(self._f, CSV_FIELDS)
+            if new_file:
+                self._writer.writeheader()
+
+    def write(self, row):
+        if self.csv:
+            top = row.get("top_k") or [{}]
+            self._writer.writerow({
+                "file": row["file"],
+                "label": row.get("label", ""),
+                "class_id": row.get("class_id", ""),
+                "probability": top[0].get("probability", ""),
+                "error": row.get("error", ""),
+            })
+        else:
+            self._f.write(json.dumps(row) + "\n")
+
+    def flush(self):
+        self._f.flush()
+
+    def close(self):
+        self._f.close()
+
+
+def _load(read, out, cache):
+    """Return ``(cache key, cached probabilities)``; on a miss the image is decoded into ``out``."""
+    data = read()
+    key = None
+    if cache is not None:
+        key = cache.key(data)
+        probs = cache.get(key)
+        if probs is not None:
+            return key, probs
+    preprocess.preprocess_into(data, out)
+    return key, None
+
+
+def score(model, class_indices, input_path, out_path, batch_size=32, workers=4, top_k=main.TOP_K, cache=None):
+    _drop_partial_line(out_path)
+    done = load_done(out_path)
+    writer = ResultWriter(out_path)
+    counts = collections.Counter(skipped=0, scored=0, cached=0, failed=0)
+    start = time.perf_counter()
+
+    def todo():
+        for name, read in iter_sources(input_path):
+            if name in done:
+                counts["skipped"] += 1
+            else:
+                yield name, read
+
+    def submit(pool, sources, buffer):
+        items = []
+        for name, read in sources:
+            items.append((name, pool.submit(_load, read, buffer.array[len(items)], cache)))
+            if len(items) == buffer.size:
+                break
+        return items
+
+    def finish(items, buffer):
+        names, keys, slots = [], [], []
+        for slot, (name, future) in enumerate(items):
+            try:
+                key, cached = future.result()
+            except Exception as e:
+                writer.write({"file": name, "error": f"{type(e).__name__}: {e}"})
+                counts["failed"] += 1
+                print(f"skipping {name}: {e}", file=sys.stderr)
+                continue
+            if cached is not None:
+                writer.write({"file": name, **main.decode_prediction(cached, class_indices, top_k)})
+                counts["cached"] += 1
+                continue
+            names.append(name)
+            keys.append(key)
+            slots.append(slot)
+        if names:
+            # Only a batch with failures or cache hits needs a compacting copy
+            batch = buffer.view(len(items)) if len(slots) == len(items) else buffer.array[slots]
+            probs = main.run_model(model, batch)
+            for name, key, row in zip(names, keys, probs):
+                if key is not None:
+                    cache.put(key, row)
+                writer.write({"file": name, **main.decode_prediction(row, class_indices, top_k)})
+            counts["scored"] += len(names)
+        writer.flush()
+
+    # Two buffers: decoder threads fill one while the model reads the other
+    buffers = [preprocess.BatchBuffer(batch_size) for _ in range(2)]
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            sources = todo()
+            current = 0
+            items = submit(pool, sources, buffers[current])
+            while items:
+                upcoming = submit(pool, sources, buffers[1 - current])
+                finish(items, buffers[current])
+                items, current = upcoming, 1 - current
+    finally:
+        writer.close()
+
+    elapsed = time.perf_counter() - start
+    counts["seconds"] = round(elapsed, 2)
+    counts["images_per_second"] = round((counts["scored"] + counts["cached"]) / elapsed, 2) if elapsed else 0.0
+    return dict(counts)
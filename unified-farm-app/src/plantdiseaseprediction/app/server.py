@@ -0,0 +1,241 @@
+"""Long-lived HTTP/JSON server for the plant disease model.
+
+The model and class names are loaded once at startup instead of once per
+upload.  Endpoints:
+
+    GET  /health            -> {"status": "ok"}
+    GET  /stats             -> batching (or worker pool), cascade routing and
+                               prediction cache counters
+    GET  /metrics           -> Prometheus text: request counters, per-stage
+                               histograms (sampled requests), batch sizes, cascade
+                               routing, cache
+    GET  /debug/slowest     -> the slowest sampled requests, with a cProfile dump
+                               of the request thread when one was taken
+    POST /predict[?top_k=N] -> body is the raw image bytes,
+                 [&cache=0]    returns {"label", "class_id", "top_k"};
+                               cache=0 skips the prediction cache
+
+Every /predict response carries a ``Server-Timing`` header with the time
+spent in this process so the caller can tell it apart from the hop.  A
+request not answered within ``request_timeout`` seconds gets HTTP 504.
+
+With ``workers > 0`` this process only parses requests, decodes images and
+serves the cache; the forward passes run in a ``pool.WorkerPool`` of model
+processes (see ``pool.py``).
+"""
+import json
+import logging
+import time
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import main
+import preprocess
+from batching import MicroBatcher, QueueFullError
+from metrics import Metrics
+from pool import TASK_TIMEOUT, WorkerPool
+
+log = logging.getLogger("plantdisease")
+
+MAX_UPLOAD_BYTES = 20 * 1024 * 1024
+WORKER_START_TIMEOUT = 300.0
+REQUEST_TIMEOUT = 60.0
+
+
+class Predictor:
+    """Holds the loaded model; concurrent requests are coalesced by a MicroBatcher.
+
+    Given a ``pool`` instead, uploads are decoded straight into its shared
+    memory and the model runs in the worker processes.
+    """
+
+    def __init__(self, model, class_indices, top_k=main.TOP_K, max_batch_size=16, max_wait_ms=5.0, max_queue=256,
+                 cache=None, pool=None, request_timeout=REQUEST_TIMEOUT):
+        self.model = model
+        self.class_indices = class_indices
+        self.top_k = top_k
+        self.request_timeout = request_timeout
+        self.cache = cache
+        self.pool = pool
+        if pool is not None:
+            self.batcher = pool  # same stats() as a MicroBatcher, plus per-worker counters
+            self.routing = pool.routing
+        else:
+            self.batcher = MicroBatcher(
+                lambda batch: main.run_model(model, batch), max_batch_size, max_wait_ms, max_queue
+            )
+            self.routing = getattr(model, "routing", None)  # set for a cascade.Cascade
+
+    def predict_bytes(self, data, top_k=None, use_cache=True, trace=None):
+        key = probs = None
+        if self.cache is not None:
+            if use_cache:
+                key = self.cache.key(data)
+                probs = self.cache.get(key)
+            else:
+                self.cache.bypass()
+            if trace is not None:
+                trace.attrs["cache"] = "bypass" if not use_cache else "miss" if probs is None else "hit"
+                trace.mark("cache_lookup")
+        if probs is None:
+            if self.pool is not None:
+                # A hung worker is killed by the pool's monitor, which recovers the request's slot
+                probs = self.pool.predict(data, self.request_timeout, trace)
+            else:
+                # Decoded straight into one of the batcher's preallocated slots
+                future = self.batcher.submit_into(lambda slot: preprocess.preprocess_into(data, slot, trace), trace)
+                try:
+                    probs = future.result(self.request_timeout)
+                except FutureTimeoutError:
+                    future.cancel()  # the batcher skips it if it has not run yet
+                    raise
+            if trace is not None:
+                trace.skip()  # queue_wait and predict were booked by the batcher
+            if key is not None:
+                self.cache.put(key, probs)
+        result = main.decode_prediction(probs, self.class_indices, top_k or self.top_k)
+        if trace is not None:
+            trace.mark("decode_result")
+        return result
+
+    def stats(self):
+        stats = {"pool" if self.pool is not None else "batching": self.batcher.stats()}
+        if self.routing is not None:
+            stats["cascade"] = self.routing.stats()
+        if self.cache is not None:
+            stats["cache"] = self.cache.stats()
+        return stats
+
+
+class Server(ThreadingHTTPServer):
+    daemon_threads = True
+    # The stdlib default backlog of 5 resets connections under bursty load
+    request_queue_size = 128
+
+
+class Handler(BaseHTTPRequestHandler):
+    server_version = "PlantDisease/1.0"
+
+    def _send(self, status, body, content_type, headers=()):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in headers:
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_json(self, status, payload, headers=()):
+        self._send(status, json.dumps(payload).encode(), "application/json", headers)
+
+    def do_GET(self):
+        path = urlparse(self.path).path
+        if path == "/health":
+            return self._send_json(200, {"status": "ok"})
+        if path == "/stats":
+            return self._send_json(200, self.server.predictor.stats())
+        if path == "/metrics":
+            predictor = self.server.predictor
+            text = self.server.metrics.render(predictor.batcher, predictor.cache, predictor.routing)
+            return self._send(200, text.encode(), "text/plain; version=0.0.4")
+        if path == "/debug/slowest":
+            return self._send_json(200, self.server.metrics.slowest())
+        self._send_json(404, {"error": "Not found"})
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        if url.path != "/predict":
+            return self._send_json(404, {"error": "Not found"})
+
+        start = time.perf_counter()
+        metrics = self.server.metrics
+        trace = metrics.start()
+        status = 500
+        try:
+            status, payload = self._predict(url, trace)
+        finally:
+            # Always count the request and finish its trace, which also releases the profiler
+            server_ms = (time.perf_counter() - start) * 1000
+            metrics.count(status)
+            if trace is not None:
+                metrics.record(trace, status=status)
+        self._send_json(status, payload, [("Server-Timing", f"app;dur={server_ms:.1f}")])
+
+    def _predict(self, url, trace):
+        length = int(self.headers.get("Content-Length") or 0)
+        if length <= 0:
+            return 400, {"error": "No image data provided"}
+        if length > MAX_UPLOAD_BYTES:
+            return 413, {"error": "Image too large"}
+
+        query = parse_qs(url.query)
+        try:
+            top_k = int(query.get("top_k", [0])[0]) or None
+        except ValueError:
+            return 400, {"error": "top_k must be an integer"}
+        use_cache = query.get("cache", ["1"])[0] not in ("0", "false")
+
+        data = self.rfile.read(length)
+        if trace is not None:
+            trace.attrs["bytes"] = length
+            trace.mark("read_body")
+        try:
+            return 200, self.server.predictor.predict_bytes(data, top_k, use_cache, trace)
+        except QueueFullError as e:
+            return 503, {"error": "Server busy, try again", "details": str(e)}
+        except FutureTimeoutError:
+            # Before OSError: TimeoutError is one
+            timeout = self.server.predictor.request_timeout
+            return 504, {"error": "Prediction timed out", "details": f"no answer within {timeout:g}s"}
+        except (OSError, ValueError) as e:
+            # PIL raises UnidentifiedImageError (an OSError) for non-images
+            return 400, {"error": "Could not read image", "details": str(e)}
+        except Exception as e:
+            # A model/runtime failure still gets an answer instead of a dropped connection
+            log.exception("prediction failed")
+            return 500, {"error": "Prediction failed", "details": f"{type(e).__name__}: {e}"}
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve(host, port, model_path=main.model_path, class_indices_path=main.class_indices_path, top_k=main.TOP_K,
+          max_batch_size=16, max_wait_ms=5.0, max_queue=256, cache=None, backend=None,
+          metrics_sample_rate=0.0, profile_slowest=0, profile_dir=None,
+          workers=0, threads_per_worker=1, affinity=False, slots=None,
+          cascade_model=None, cascade_threshold=main.CASCADE_THRESHOLD,
+          request_timeout=REQUEST_TIMEOUT, task_timeout=TASK_TIMEOUT):
+    # Sampled requests are logged as one JSON line each on stderr
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    start = time.perf_counter()
+    class_indices = main.load_class_indices(class_indices_path)
+    model = pool = None
+    if workers:
+        pool = WorkerPool(model_path, backend, workers, threads_per_worker, affinity, max_batch_size, slots,
+                          cascade_model, cascade_threshold, task_timeout)
+        try:
+            pool.wait_ready(WORKER_START_TIMEOUT)
+        except Exception:
+            pool.close()
+            raise
+        print(f"{workers} model workers ({threads_per_worker} thread(s) each) ready in "
+              f"{time.perf_counter() - start:.1f}s", flush=True)
+    else:
+        model = main.load_model(model_path, backend, cascade_model=cascade_model, cascade_threshold=cascade_threshold)
+        main.warm_up(model)
+        print(f"{model.name} model loaded and warmed up in {time.perf_counter() - start:.1f}s", flush=True)
+
+    httpd = Server((host, port), Handler)
+    httpd.predictor = Predictor(model, class_indices, top_k, max_batch_size, max_wait_ms, max_queue, cache, pool,
+                                request_timeout)
+    httpd.metrics = Metrics(metrics_sample_rate, profile_slowest, profile_dir)
+    print(f"Serving plant disease predictions on http://{host}:{port}", flush=True)
+    try:
+        httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        httpd.server_close()
+        if pool is not None:
+            pool.close()
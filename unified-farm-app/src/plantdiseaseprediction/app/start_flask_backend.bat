@@ -1,16 +1,20 @@
 @echo off
-REM === Flask Auto-Restart Script ===
+REM === Model Server Launch Script ===
 REM Set your backend directory here:
 cd /d "C:\Users\punya mittal\Downloads\team_1B-main-1\team_1B-main-1\unified-farm-app\src\plantdiseaseprediction\app"
 
 REM Uncomment the next line if you use a virtual environment:
 REM call venv\Scripts\activate
 
-:loop
-echo Starting Flask backend...
-set FLASK_APP=main.py
-set FLASK_ENV=development
-flask run --host=0.0.0.0 --port=5000
-echo Flask crashed or stopped. Restarting in 5 seconds...
-timeout /t 5
-goto loop 
\ No newline at end of file
+REM Each model worker is a full TensorFlow process (about 1.2 GB RSS with the
+REM Keras model), so use a few multi-threaded workers rather than one per core:
+REM workers = cores / threads per worker, at least 1. Two to four workers is
+REM usually enough to keep the cores busy; raise PLANT_DISEASE_THREADS_PER_WORKER
+REM to save memory, lower it for more requests in parallel. Crashed workers are
+REM restarted by the server itself, so no restart loop is needed here.
+if not defined PLANT_DISEASE_THREADS_PER_WORKER set PLANT_DISEASE_THREADS_PER_WORKER=4
+if not defined PLANT_DISEASE_WORKERS set /a PLANT_DISEASE_WORKERS=%NUMBER_OF_PROCESSORS% / %PLANT_DISEASE_THREADS_PER_WORKER%
+if %PLANT_DISEASE_WORKERS% LSS 1 set PLANT_DISEASE_WORKERS=1
+
+echo Starting plant disease model server with %PLANT_DISEASE_WORKERS% workers x %PLANT_DISEASE_THREADS_PER_WORKER% threads...
+python main.py serve --host 127.0.0.1 --port 5000 --workers %PLANT_DISEASE_WORKERS% --threads-per-worker %PLANT_DISEASE_THREADS_PER_WORKER%
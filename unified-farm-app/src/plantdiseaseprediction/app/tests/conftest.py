@@ -0,0 +1,20 @@
+"""Run from the app directory: python -m pytest tests.  Nothing here needs TensorFlow."""
+import os
+import sys
+
+import pytest
+
+# The app modules import each other as top-level modules, as when run from the app directory
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import stubs  # noqa: E402
+
+
+@pytest.fixture
+def model():
+    return stubs.StubBackend()
+
+
+@pytest.fixture
+def class_indices():
+    return dict(stubs.CLASSES)
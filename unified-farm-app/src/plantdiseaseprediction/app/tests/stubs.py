@@ -0,0 +1,56 @@
+"""A TensorFlow-free stand-in for the model and helpers to make test images."""
+import io
+import os
+import time
+
+import numpy as np
+from PIL import Image
+
+import backends
+
+CLASSES = {"0": "red", "1": "green", "2": "blue", "3": "grey"}
+
+# Images of these colours stand in for requests that crash or wedge the model runtime
+CRASH = (255, 0, 255)
+HANG = (255, 255, 0)
+
+
+class StubBackend(backends.Backend):
+    """Answers the dominant colour of each image, optionally taking ``delay`` seconds per batch."""
+    name = "stub"
+
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.batches = []
+
+    def predict(self, batch):
+        self.batches.append(len(batch))
+        colours = np.rint(batch.mean(axis=(1, 2)) * 255)
+        for colour in colours:
+            if tuple(colour) == CRASH:
+                os._exit(70)
+            if tuple(colour) == HANG:
+                time.sleep(3600)
+        time.sleep(self.delay)
+        classes = np.where(np.ptp(colours, axis=1) < 25, 3, colours.argmax(axis=1))
+        probs = np.full((len(batch), len(CLASSES)), 0.1 / (len(CLASSES) - 1), dtype=np.float32)
+        probs[np.arange(len(batch)), classes] = 0.9
+        return probs
+
+
+def load_stub(path, backend=None, num_threads=None, inter_op_threads=None, **kwargs):
+    """``main.load_model`` replacement for pool workers; ``path`` is the seconds each batch takes."""
+    return StubBackend(float(path))
+
+
+def image_bytes(colour, size=(64, 48), fmt="PNG"):
+    buf = io.BytesIO()
+    Image.new("RGB", size, colour).save(buf, fmt)
+    return buf.getvalue()
+
+
+def write_image(path, colour, size=(64, 48)):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(image_bytes(colour, size))
+    return path
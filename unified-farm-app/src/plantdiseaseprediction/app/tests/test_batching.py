@@ -0,0 +1,84 @@
+import threading
+import time
+
+import numpy as np
+import pytest
+
+from batching import MicroBatcher, QueueFullError
+
+SHAPE = (4, 4, 3)
+
+
+def _image(value=0.0):
+    return np.full(SHAPE, value, dtype=np.float32)
+
+
+def test_max_wait_counts_from_when_the_oldest_request_was_queued():
+    calls, running = [], threading.Event()
+
+    def run_batch(batch):
+        start = time.perf_counter()
+        running.set()
+        time.sleep(0.3)
+        calls.append((start, time.perf_counter(), len(batch)))
+        return np.zeros((len(batch), 2), dtype=np.float32)
+
+    batcher = MicroBatcher(run_batch, max_batch_size=4, max_wait_ms=200, max_queue=8, image_shape=SHAPE)
+    first = batcher.submit(_image())
+    running.wait(5)
+    second = batcher.submit(_image())  # queued while the first forward pass runs
+    first.result(5)
+    second.result(5)
+    (_, first_end, _), (second_start, _, size) = calls
+    assert size == 1
+    assert second_start - first_end < 0.1  # it already waited 0.3s > max_wait, no extra wait
+
+
+def _blocking_batcher(**kwargs):
+    """A batcher whose first forward pass waits for ``release``; each row answers its image's value."""
+    release, batches = threading.Event(), []
+
+    def run_batch(batch):
+        release.wait(5)
+        batches.append(len(batch))
+        return batch[:, 0, 0, :1].copy()
+
+    return MicroBatcher(run_batch, image_shape=SHAPE, **kwargs), release, batches
+
+
+def test_requests_queued_behind_a_forward_pass_form_full_batches():
+    batcher, release, batches = _blocking_batcher(max_batch_size=4, max_wait_ms=50, max_queue=16)
+    futures = [batcher.submit(_image(0))]
+    time.sleep(0.1)  # the first request is in the forward pass
+    futures += [batcher.submit(_image(i)) for i in range(1, 7)]
+    release.set()
+    assert [float(f.result(5)[0]) for f in futures] == list(range(7))
+    assert batches == [1, 4, 2]
+    assert batcher.stats()["batch_sizes"] == {1: 1, 2: 1, 4: 1}
+
+
+def test_full_queue_rejects_requests():
+    batcher, release, _ = _blocking_batcher(max_batch_size=1, max_queue=2)
+    running = batcher.submit(_image(1))
+    time.sleep(0.1)  # taken off the queue, its slot is free again
+    queued = [batcher.submit(_image(2)), batcher.submit(_image(3))]
+    with pytest.raises(QueueFullError):
+        batcher.submit(_image(4))
+    assert batcher.stats()["rejected"] == 1
+    release.set()
+    assert [float(f.result(5)[0]) for f in [running, *queued]] == [1, 2, 3]
+    assert batcher.submit(_image(5)).result(5)[0] == 5  # slots come back once answered
+
+
+def test_failed_decode_frees_its_slot():
+    batcher, release, _ = _blocking_batcher(max_queue=1)
+    release.set()
+
+    def bad_decode(slot):
+        raise ValueError("not an image")
+
+    for _ in range(3):
+        with pytest.raises(ValueError):
+            batcher.submit_into(bad_decode)
+    assert batcher.predict_into(lambda slot: slot.fill(7), timeout=5)[0] == 7
+    assert batcher.stats()["rejected"] == 0
@@ -0,0 +1,63 @@
+import numpy as np
+
+import cache
+
+
+def test_disk_tier_keeps_most_recently_used_rows(tmp_path, monkeypatch):
+    monkeypatch.setattr(cache, "DB_PRUNE_EVERY", 10)
+    db = str(tmp_path / "cache.sqlite")
+    retired = cache.PredictionCache("old-model", db_path=db)
+    for i in range(30):
+        retired.put(retired.key(b"old%d" % i), np.ones(4))
+    retired.close()
+
+    predictions = cache.PredictionCache("new-model", max_bytes=0, db_path=db, max_db_rows=40)
+    assert predictions.stats()["disk_evictions"] == 0
+    for i in range(40):
+        predictions.put(predictions.key(b"%d" % i), np.full(4, i))
+    stats = predictions.stats()
+    assert stats["disk_rows"] == 40 and stats["disk_evictions"] == 30  # the retired model's rows went first
+    predictions.close()
+
+    reopened = cache.PredictionCache("new-model", db_path=db, max_db_rows=40)
+    assert reopened.get(reopened.key(b"0"))[0] == 0
+    assert reopened.stats()["disk_hits"] == 1
+
+
+def test_memory_tier_is_a_byte_bounded_lru():
+    probs = np.zeros(4, dtype=np.float32)
+    predictions = cache.PredictionCache("model")
+    entry = len(predictions.key(b"a")) + probs.nbytes
+    predictions.max_bytes = 3 * entry
+    a, b, c, d = (predictions.key(x) for x in (b"a", b"b", b"c", b"d"))
+    for key in (a, b, c):
+        predictions.put(key, probs)
+    assert predictions.get(a) is not None  # now the most recently used
+    predictions.put(d, probs)
+
+    assert predictions.get(b) is None
+    assert all(predictions.get(key) is not None for key in (a, c, d))
+    stats = predictions.stats()
+    assert stats["evictions"] == 1 and stats["entries"] == 3 and stats["bytes"] == 3 * entry
+
+
+def test_put_keeps_a_copy():
+    predictions = cache.PredictionCache("model")
+    batch = np.ones((2, 4), dtype=np.float32)
+    predictions.put("k", batch[0])
+    batch[0] = 0
+    assert predictions.get("k").base is None and predictions.get("k")[0] == 1
+
+
+def test_swapping_the_model_file_changes_every_key(tmp_path):
+    model_file, classes = tmp_path / "model.h5", tmp_path / "classes.json"
+    model_file.write_bytes(b"weights v1")
+    classes.write_text('{"0": "red"}')
+    old = cache.PredictionCache(cache.fingerprint(str(model_file), str(classes)))
+    old.put(old.key(b"leaf"), np.ones(4))
+
+    model_file.write_bytes(b"weights v2")
+    new = cache.PredictionCache(cache.fingerprint(str(model_file), str(classes)))
+    assert new.model_fingerprint != old.model_fingerprint
+    assert new.key(b"leaf") != old.key(b"leaf")
+    assert cache.fingerprint(str(model_file), str(classes), salt="x") != new.model_fingerprint
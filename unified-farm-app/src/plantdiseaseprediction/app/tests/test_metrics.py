@@ -0,0 +1,25 @@
+import os
+
+from metrics import Metrics
+
+
+def test_slowest_requests_are_kept_with_or_without_a_profile(tmp_path):
+    metrics = Metrics(sample_rate=1.0, profile_slowest=2, profile_dir=str(tmp_path))
+    profiled = metrics.start()
+    others = [metrics.start() for _ in range(3)]  # concurrent: the profiler is taken
+    assert profiled.profile is not None and all(t.profile is None for t in others)
+    for trace, seconds in zip(others, (0.03, 0.0, 0.02)):
+        trace.start -= seconds
+        metrics.record(trace, status=200)
+    metrics.record(profiled, status=200)
+
+    slowest = metrics.slowest()
+    assert [round(r["total_ms"], -1) for r in slowest] == [30, 20]
+    assert not any("profile" in r for r in slowest)
+    assert os.listdir(str(tmp_path)) == []  # the profiled request was not among the slowest
+
+    late = metrics.start()
+    late.start -= 0.05
+    metrics.record(late, status=200)
+    slowest = metrics.slowest()
+    assert os.path.exists(slowest[0]["profile"]) and len(slowest) == 2
@@ -0,0 +1,65 @@
+import time
+
+import pytest
+
+import pool
+import stubs
+from pool import WorkerPool
+
+
+@pytest.fixture
+def make_pool():
+    pools = []
+
+    def make(delay=0.0, **kwargs):
+        workers = WorkerPool(str(delay), loader=stubs.load_stub, **kwargs)
+        pools.append(workers)
+        workers.wait_ready(60)
+        return workers
+
+    yield make
+    for workers in pools:
+        workers.close()
+
+
+def test_hung_worker_is_killed_and_its_requests_recovered(make_pool):
+    workers = make_pool(workers=2, task_timeout=1.0)
+    hung = workers.submit(stubs.image_bytes(stubs.HANG))
+    time.sleep(0.2)
+    healthy = [workers.submit(stubs.image_bytes((240, 10, 10))) for _ in range(4)]
+    assert all(f.result(30)[0] > 0.5 for f in healthy)  # not stuck behind the hung worker
+    with pytest.raises(RuntimeError, match="crashed or hung 3 times"):
+        hung.result(60)
+    stats = workers.stats()
+    assert sum(w["hangs"] for w in stats["workers"]) == 3
+    assert stats["free_slots"] == workers.slots
+
+
+def test_requests_of_a_killed_worker_are_redispatched(make_pool, monkeypatch):
+    monkeypatch.setattr(pool, "RESTART_DELAY", 0.1)
+    workers = make_pool(delay=0.5, workers=2, max_batch_size=2)
+    futures = [workers.submit(stubs.image_bytes((10, 10, 240))) for _ in range(6)]
+    time.sleep(0.2)
+    busy = max(workers.stats()["workers"], key=lambda w: w["in_flight"])
+    assert busy["in_flight"] > 0
+    workers._workers[busy["id"]].process.kill()
+
+    assert all(f.result(60).argmax() == 2 for f in futures)
+    stats = workers.stats()
+    assert stats["workers"][busy["id"]]["restarts"] == 1
+    assert stats["free_slots"] == workers.slots and stats["queue_depth"] == 0
+
+
+def test_poison_request_fails_after_max_redispatches(make_pool, monkeypatch):
+    monkeypatch.setattr(pool, "RESTART_DELAY", 0.1)
+    workers = make_pool(delay=0.05, workers=2)
+    healthy = [workers.submit(stubs.image_bytes((240, 10, 10))) for _ in range(3)]
+    poison = workers.submit(stubs.image_bytes(stubs.CRASH))
+    healthy += [workers.submit(stubs.image_bytes((10, 240, 10))) for _ in range(3)]
+
+    with pytest.raises(RuntimeError, match=f"crashed or hung {pool.MAX_REDISPATCHES + 1} times"):
+        poison.result(60)
+    assert [f.result(60).argmax() for f in healthy] == [0, 0, 0, 1, 1, 1]
+    workers.wait_ready(60)
+    assert workers.predict(stubs.image_bytes((240, 10, 10)), timeout=30).argmax() == 0
+    assert workers.stats()["free_slots"] == workers.slots
@@ -0,0 +1,39 @@
+import io
+
+import numpy as np
+from PIL import Image
+
+import main
+import preprocess
+import stubs
+
+
+def _rotated_jpeg():
+    # Left half red, right half blue, stored sideways with an EXIF "rotate 90" tag
+    img = Image.new("RGB", (1600, 1200), (200, 30, 30))
+    img.paste((30, 30, 200), (800, 0, 1600, 1200))
+    exif = Image.Exif()
+    exif[0x0112] = 6
+    buf = io.BytesIO()
+    img.save(buf, "JPEG", exif=exif)
+    return buf.getvalue()
+
+
+def test_cli_and_server_preprocess_alike():
+    data = _rotated_jpeg()
+    served = preprocess.preprocess_into(data, np.empty((224, 224, 3), dtype=np.float32))
+    for source in (data, io.BytesIO(data)):
+        image = main.preprocess_image(source)
+        assert image.dtype == np.float32
+        np.testing.assert_array_equal(image, served)
+    # Upright, the red half is on top
+    assert served[:100, :, 0].mean() > served[124:, :, 0].mean()
+
+
+def test_predict_class_uses_cache(model, class_indices, tmp_path):
+    import cache
+    path = stubs.write_image(str(tmp_path / "leaf.png"), (10, 240, 10))
+    predictions = cache.PredictionCache("test")
+    assert main.predict_class(model, path, class_indices, predictions) == "green"
+    assert main.predict_class(model, path, class_indices, predictions) == "green"
+    assert predictions.stats()["hits"] == 1 and model.batches == [1]
@@ -0,0 +1,80 @@
+import csv
+import json
+import os
+
+import pytest
+
+import scoring
+import stubs
+
+
+@pytest.fixture
+def images(tmp_path):
+    folder = tmp_path / "images"
+    stubs.write_image(str(folder / "a.png"), (250, 10, 10))
+    stubs.write_image(str(folder / "b.png"), (10, 250, 10))
+    stubs.write_image(str(folder / "sub" / "c.png"), (10, 10, 250))
+    return str(folder)
+
+
+def _jsonl(path):
+    with open(path) as f:
+        return [json.loads(line) for line in f]
+
+
+def test_scores_every_image(model, class_indices, images, tmp_path):
+    out = str(tmp_path / "out.jsonl")
+    counts = scoring.score(model, class_indices, images, out, batch_size=2)
+    assert counts["scored"] == 3
+    assert {row["file"]: row["label"] for row in _jsonl(out)} == {"a.png": "red", "b.png": "green",
+                                                                 "sub/c.png": "blue"}
+
+
+def test_resume_skips_finished_files(model, class_indices, images, tmp_path):
+    out = str(tmp_path / "out.jsonl")
+    scoring.score(model, class_indices, images, out)
+    counts = scoring.score(model, class_indices, images, out)
+    assert counts["skipped"] == 3 and counts["scored"] == 0
+    assert len(_jsonl(out)) == 3
+
+
+@pytest.mark.parametrize("name", ["out.jsonl", "out.csv"])
+def test_resume_after_interrupted_write(model, class_indices, images, tmp_path, name):
+    out = str(tmp_path / name)
+    scoring.score(model, class_indices, images, out)
+    with open(out, "rb") as f:
+        data = f.read()
+    with open(out, "wb") as f:
+        f.write(data[:-12])  # cut the last record in half
+
+    counts = scoring.score(model, class_indices, images, out)
+    assert counts["scored"] == 1 and counts["skipped"] == 2
+    if name.endswith(".csv"):
+        with open(out, newline="") as f:
+            rows = list(csv.DictReader(f))
+    else:
+        rows = _jsonl(out)  # every line parses
+    assert sorted(row["file"] for row in rows) == ["a.png", "b.png", "sub/c.png"]
+    assert all(row["label"] for row in rows)
+
+
+def test_resume_after_write_cut_inside_header(model, class_indices, images, tmp_path):
+    out = str(tmp_path / "out.csv")
+    with open(out, "w") as f:
+        f.write("file,la")
+    scoring.score(model, class_indices, images, out)
+    with open(out, newline="") as f:
+        assert len(list(csv.DictReader(f))) == 3
+    assert os.path.getsize(out) > 0
+
+
+def test_unreadable_image_is_recorded_and_skipped(model, class_indices, images, tmp_path):
+    with open(os.path.join(images, "broken.png"), "wb") as f:
+        f.write(b"not an image at all")
+    out = str(tmp_path / "out.jsonl")
+    counts = scoring.score(model, class_indices, images, out, batch_size=2)
+    assert counts["failed"] == 1 and counts["scored"] == 3
+    rows = {row["file"]: row for row in _jsonl(out)}
+    assert "error" in rows["broken.png"] and rows["sub/c.png"]["label"] == "blue"
+
+    assert scoring.score(model, class_indices, images, out)["skipped"] == 4  # not retried on resume